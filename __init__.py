@@ -1,34 +1,134 @@
 from binaryninja import *
-from binja_toolbar import add_image_button
-from multiprocessing.connection import Client
+from binja_toolbar import add_image_button, get_toolbar
+from . import branch
+from . import protocol
+from . import sessionlog
+from .coverage import Coverage
+from .docks import RegistersDockWidget, StackDockWidget
+from .functions import FunctionIndex, SymbolCache
+from .highlights import Highlights
+from .history import RegisterHistory
+from .memory import PageCache
+from .modules import ModuleTable
+from .stats import Stats
+from .tracefile import TraceReader
+import math
 import os
-import subprocess
+import re
+import struct
 import threading
 import time
-import win32com.client
-import win32con
-import win32gui
-import win32process
+try:
+    import Queue as queue
+except ImportError:
+    import queue
+# win32 and subprocess are imported where they're first needed, so loading
+# the plugin stays cheap when nothing is being debugged
 
 pykd_path = "C:\\path\\to\\pykd.dll"
 dbg_dir = "C:\\Program Files (x86)\\Windows Kits\\10\\Debuggers"
 poll_time = .25
-no_color = HighlightStandardColor.NoHighlightColor
+launch_timeout = 30
+connect_retry = .05
+connect_retry_max = 2
+dispatch_queue_size = 1024
 ip_color = HighlightStandardColor.YellowHighlightColor
 enabled_bp_color = HighlightStandardColor.RedHighlightColor
 hit_bp_color = HighlightStandardColor.OrangeHighlightColor
 cond_jump_color = HighlightStandardColor.GreenHighlightColor
+trace_capacity = 1 << 22
+trace_regs = {
+    'x86': ['eax', 'ebx', 'ecx', 'edx', 'esi', 'edi', 'ebp', 'esp'],
+    'x86_64': ['rax', 'rbx', 'rcx', 'rdx', 'rsi', 'rdi', 'rbp', 'rsp'],
+}
+memory_cache_pages = 1024
+memory_timeout = 2
+register_history_bytes = 16 << 20
+step_limit = 100000     # instructions, for the step until ... commands
+step_summary_blocks = 20
+log_comment_lines = 8   # newest log point samples kept in each comment
+# matches the sample lines log points add to comments, e.g. #12 ecx=0x0
+log_line_regex = re.compile(r"#\d+(\s|$)")
+# matches the line show_trace adds to conditional branches, e.g. taken 3/4
+taken_line_regex = re.compile(r"taken \d+/\d+$")
+value_formats = {1: '<B', 2: '<H', 4: '<I', 8: '<Q'}
+primaries = set()   # sessions that own a connection to WinDbg
 
 
 class BinDbgSession:
-    def __init__(self, bv):
+    """Debugger state for one BinaryView
+
+    The session that starts WinDbg is the primary: it owns the connection,
+    the register state and the table of modules loaded in the target, and
+    routes every message to the session whose module contains the address.
+    Sessions for other modules are attached to the primary.
+    """
+
+    def __init__(self, bv, primary=None, replay=None):
         self.bv = bv
+        self.primary = primary or self
+        # before any thread starts, since drain ignores inactive sessions
+        bv.session_data['bindbg'] = self
+        self.module_name = os.path.splitext(
+            os.path.basename(bv.file.filename))[0].lower()
+        self.module_base = None
         self.conn = None
         self.windbg_proc = None
-        self.regs = None
         self.ip = None
         self.bps = set()
-        
+        self.functions = FunctionIndex(bv)
+        self.symbols = SymbolCache(bv)
+        self.highlights = Highlights(self.functions)
+        self.branches = { }
+        self.coverage = None
+        self.call_targets = { }     # call site -> {target: visits}
+        self.call_comments = { }    # call site -> comment line per target
+        self.overlay = False
+        self.overlay_comments = { }     # data var -> (user's comment, shown)
+        self.data_refs = { }        # function start -> data vars it references
+        self.bp_rules = { }         # breakpoint -> condition, hit_count, log
+        self.log_lines = { }        # log point -> newest sample lines
+        self.bps_dirty = False
+        self.call_targets_dirty = False
+        self.saved_call_targets = { }
+        self.restore_state()
+
+        if primary:
+            primary.attach(self)
+            return
+
+        self.regs = { }
+        self.modules = ModuleTable()
+        # until the debugger sends its modules the table only has the layout
+        # of the last session, which names addresses but can't place them
+        self.modules_synced = False
+        self.views = {self.module_name: self}
+        self.ip_session = None
+        self.coverage_session = None
+        self.trace_path = None
+        self.trace = None
+        self.stack = []     # frame IPs, outermost first
+        self.stack_dock = None
+        self.history = RegisterHistory(register_history_bytes)
+        self.regs_dock = None
+        self.memory = PageCache(memory_cache_pages)
+        self.page_requests = { }    # request ID -> (cache generation, event)
+        self.next_request = 0
+        self.pending = queue.Queue(maxsize=dispatch_queue_size)
+        self.dispatch_lock = threading.Lock()
+        self.drain_scheduled = False
+        self.stats = Stats()
+        self.session_log = None
+        self.replay = replay    # (log path, keep original timing)
+        self.modules_dirty = False
+        self.restore_modules()
+
+        if replay:
+            t = threading.Thread(target=self.replay_loop)
+            t.setDaemon(True)
+            t.start()
+            return
+
         if not 'proc_args' in self.bv.session_data:
             self.bv.session_data['proc_args'] = ''
 
@@ -37,61 +137,116 @@ class BinDbgSession:
                 "Enter BinDbg pipe name:",
                 "Start BinDbg session",
             )
+        save_settings(self.bv)
 
         t = threading.Thread(target=self.event_loop)
         t.setDaemon(True)
         t.start()
 
 
+    def active(self):
+        return self.bv.session_data.get('bindbg') is self
+
+
+    def stop_later(self, reason):
+        """Stops from the UI thread, so highlights aren't cleared under a
+        drain that's applying them"""
+        execute_on_main_thread(lambda: self.stop(reason))
+
+
     def stop(self, reason):
-        if 'bindbg' in self.bv.session_data:
-            if self.bv.session_data['bindbg'].windbg_proc:
+        if not self.active():
+            return      # stopped already, e.g. by both send and the reader
+        if self.primary is self:
+            if self.windbg_proc:
+                import win32con
+                import win32gui
                 # close windbg
-                pid = self.bv.session_data['bindbg'].windbg_proc.pid
-                for hwnd in get_hwnds_for_pid(pid):
+                for hwnd in get_hwnds_for_pid(self.windbg_proc.pid):
                     win32gui.PostMessage(hwnd, win32con.WM_CLOSE, 0, 0)
-            del self.bv.session_data['bindbg']
+                self.windbg_proc = None
 
-        if self.conn:
-            self.conn.close()
+            if self.conn:
+                self.conn.close()
 
-        for bp in self.bps.copy():
-            self.delete_bp(bp)
+            self.update_session_log(None)
 
-        if self.ip:
-            self.highlight(self.ip, no_color)
-            self.ip = None
+            for session in list(self.views.values()):
+                if session is not self:
+                    session.stop(reason)
+            primaries.discard(self)
+
+            if self.stack_dock:
+                self.stack_dock.close()
+                self.stack_dock = None
+            if self.regs_dock:
+                self.regs_dock.close()
+                self.regs_dock = None
+        else:
+            self.primary.detach(self)
+
+        del self.bv.session_data['bindbg']
+
+        self.bps.clear()
+        self.bp_rules.clear()
+        self.ip = None
+        self.overlay = False
+        self.clear_overlay()
+        # coverage and trace highlights outlive the session, like comments
+        for layer in ('breakpoint', 'ip', 'hit', 'branch'):
+            self.highlights.clear(layer)
+        self.highlights.flush()     # needs the function index still open
 
+        self.functions.close()
+        self.symbols.close()
         print(reason)
-        
-        
+
+
+    def attach(self, session):
+        self.views[session.module_name] = session
+        self.update_module_bases()
+        print("Attached {} to BinDbg session".format(session.module_name))
+
+
+    def detach(self, session):
+        if self.views.get(session.module_name) is session:
+            del self.views[session.module_name]
+        if self.ip_session is session:
+            self.ip_session = None
+
+
     def send(self, command, **params):
+        if self.primary.replay:
+            return      # nothing is listening
         try:
-            self.conn.send((command, params))
+            protocol.send(self.primary.conn, command, params,
+                self.primary.stats, self.primary.session_log)
         except IOError:
-            return self.stop("Lost connection to WinDbg")
+            return self.primary.stop_later("Lost connection to WinDbg")
 
 
     def connect(self):
+        from multiprocessing.connection import Client
         try:
             self.conn = Client('\\\\.\\pipe\\' + self.bv.session_data['pipe'])
             return True
         except WindowsError:
             return False
-    
-    
+
+
     def start_windbg(self):
+        import subprocess
         bindbg_dir = os.path.dirname(os.path.abspath(__file__))
         windbg_ext = os.path.join(bindbg_dir, 'windbg.py')
         exe_path = self.bv.file.filename.replace('.bndb', '.exe')
         exe_dir = os.path.dirname(exe_path)
-        
+
         # determine whether we should run x86 or x64 windbg
         if self.bv.arch.name == 'x86':
             windbg_path = os.path.join(dbg_dir, 'x86', 'windbg.exe')
         else:
             windbg_path = os.path.join(dbg_dir, 'x64', 'windbg.exe')
-        
+
         # save command as a script due to nested double quotes
         windbg_cmd = '.load "{}"; !py -2 --global "{}" "{}"'.format(
             pykd_path.replace('\\', '\\\\'),
@@ -115,134 +270,854 @@ class BinDbgSession:
 
 
     def event_loop(self):
+        started = time.time()
         # attempt to connect to already open windbg session
         if not self.connect():
-            # if that fails, start windbg and attempt to connect again
+            # if that fails, start windbg and wait for windbg.py to signal
+            # that its listener is up
+            import win32api
+            import win32event
+            ready = win32event.CreateEvent(None, True, False,
+                protocol.ready_event_name(self.bv.session_data['pipe']))
             self.start_windbg()
+            win32event.WaitForSingleObject(ready, int(launch_timeout * 1000))
+            win32api.CloseHandle(ready)
+
+            # fall back to polling in case the event was missed
+            delay = connect_retry
             while not self.connect():
-                # wait while windbg loads
-                time.sleep(2)
-        print("Connected to WinDbg")
-        self.send('sync')
+                time.sleep(delay)
+                delay = min(delay * 2, connect_retry_max)
+        print("Connected to WinDbg in {:.2f}s".format(time.time() - started))
+        self.send('sync', version=protocol.VERSION)
 
         while True:
             try:
                 if self.conn.poll(poll_time):
-                    self.process(self.conn.recv())
+                    self.dispatch(protocol.recv(self.conn, self.stats,
+                        self.session_log))
+            except protocol.ProtocolError as e:
+                print(e)
             except IOError as e:
                 if e.errno == 6:   # stop() has already been called
                     return
-                return self.stop("Lost connection to WinDbg")
+                return self.stop_later("Lost connection to WinDbg")
+            except EOFError:
+                return self.stop_later("Lost connection to WinDbg")
+
+
+    def replay_loop(self):
+        """Feeds the frames a session log recorded as sent to Binja through
+        the same path as live ones"""
+        path, realtime = self.replay
+        try:
+            reader = sessionlog.SessionLogReader(path)
+        except (IOError, ValueError) as e:
+            return self.stop_later("Can't replay session log: {}".format(e))
+        print("Replaying {}".format(path))
+
+        direction = reader.to_binja()
+        first = started = None
+        for when, record_direction, frame in reader:
+            if not self.active():
+                break   # stopped by the user
+            if record_direction != direction:
+                continue
+            if realtime:
+                if first is None:
+                    first, started = when, time.time()
+                delay = (when - first) - (time.time() - started)
+                if delay > 0:
+                    time.sleep(delay)
+            try:
+                cmd, params = protocol.decode(frame)
+            except protocol.ProtocolError as e:
+                print(e)
+                continue
+            params.pop('_sent', None)
+            self.dispatch((cmd, params))
+        reader.close()
+        print("Finished replaying {}".format(path))
+
+
+    def update_session_log(self, path):
+        """Starts logging every frame to path, or stops if path is None"""
+        if self.session_log:
+            self.session_log.close()
+            self.session_log = None
+        if path:
+            self.session_log = sessionlog.SessionLog(path, sessionlog.binja)
+
+
+    def dispatch(self, data):
+        # memory replies are awaited on the UI thread, so they can't be
+        # queued behind it
+        cmd, params = data
+        if cmd == 'pages':
+            return self.pages(params['id'], params['pages'], params['data'])
+        elif cmd == 'resumed':
+            return self.memory.invalidate()
+
+        # blocks the reader thread if the UI falls too far behind
+        self.pending.put(data)
+        with self.dispatch_lock:
+            if self.drain_scheduled:
+                return
+            self.drain_scheduled = True
+        execute_on_main_thread(self.drain)
+
+
+    def drain(self):
+        with self.dispatch_lock:
+            self.drain_scheduled = False
+        if not self.active():
+            return      # stopped after this was queued
+
+
+        messages = []
+        while True:
+            try:
+                messages.append(self.pending.get_nowait())
+            except queue.Empty:
+                break
+
+        # only the newest position is worth highlighting and navigating to,
+        # but the register deltas of superseded stops still have to be merged
+        last_stop = None
+        for i, (cmd, params) in enumerate(messages):
+            if cmd in ('set_ip', 'bp_hit'):
+                last_stop = i
+        for i, (cmd, params) in enumerate(messages):
+            if not self.active():
+                return  # e.g. stopped by a version mismatch
+            # toggling stats from a message must not unbalance the timing
+            timed = self.stats.enabled
+            if timed:
+                start = self.stats.clock()
+            if cmd in ('set_ip', 'bp_hit') and i != last_stop:
+                self.update_regs(params['regs'], params.get('full', False),
+                    params.get('ip', params.get('addr')))
+            else:
+                self.process((cmd, params))
+            if timed:
+                self.stats.record(cmd, 'apply', self.stats.clock() - start)
+
+        # one metadata write per view for the whole batch
+        for session in list(self.views.values()):
+            session.save_state()
 
 
     def process(self, data):
         print(data)
         cmd, params = data
 
-        if 'bp' in cmd:
-            addr = params['addr'] + self.bv.start
-            if self.bv.is_valid_offset(addr):
-                if cmd == 'set_bp':
-                    self.set_bp(addr)
-                elif cmd == 'delete_bp':
-                    self.delete_bp(addr)
-                elif cmd == 'bp_hit':
-                    self.bp_hit(addr, params['regs'])
+        if cmd == 'sync':
+            if params['version'] != protocol.VERSION:
+                return self.stop("WinDbg extension speaks BinDbg protocol "
+                    "version {}, expected {}".format(params['version'],
+                    protocol.VERSION))
+        elif cmd == 'print':
+            print(params['message'])
+        elif cmd == 'modules':
+            self.modules.clear()
+            for base, end, name in params['modules']:
+                self.modules.add(base, end, name)
+            self.modules_synced = True
+            self.update_module_bases()
+            self.modules_dirty = True
+        elif cmd == 'module_load':
+            self.modules.add(params['base'], params['end'], params['name'])
+            self.update_module_bases()
+            self.modules_dirty = True
+        elif cmd == 'module_unload':
+            self.modules.remove(params['base'])
+            self.update_module_bases()
+            self.modules_dirty = True
+        elif cmd == 'stack':
+            self.update_stack(params['keep'], params['frames'])
+        elif cmd == 'set_bps':
+            self.reconcile_bps(params['addrs'])
+        elif cmd == 'trace_done':
+            if self.trace:
+                self.trace.close()
+                self.trace = None
+            self.trace_path = params['path']
+            print("Recorded {} instructions to {}".format(params['records'],
+                self.trace_path))
+        elif cmd == 'log_samples':
+            self.log_samples(params['addrs'], params['hits'], params['values'])
+        elif cmd == 'step_done':
+            self.step_done(params['steps'], params['reason'],
+                params.get('blocks'), params.get('hits'))
+        elif cmd == 'coverage_hits':
+            if self.coverage_session:
+                self.coverage_session.coverage.add_hits(params['blocks'])
+        elif cmd == 'bps_result':
+            self.bps_result(params['cmd'], params['addrs'], params['ok'])
+        elif cmd in ('set_bp', 'delete_bp', 'bp_hit'):
+            session, addr = self.locate(params['addr'])
+            if cmd == 'bp_hit':
+                self.update_regs(params['regs'], ip=params['addr'])
+                self.show_stop()
+                self.move_ip(session, addr, hit=True)
+            elif not session:
+                pass
+            elif cmd == 'set_bp':
+                session.set_bp(addr)
+            elif cmd == 'delete_bp':
+                session.delete_bp(addr)
         elif cmd == 'set_ip':
-            ip = params['ip'] + self.bv.start
-            if self.bv.is_valid_offset(ip):
-                self.set_ip(ip, params['regs'])
+            # apply the register delta even if the IP is outside every view,
+            # otherwise later deltas would be applied to a stale base
+            self.update_regs(params['regs'], params.get('full', False),
+                params['ip'])
+            self.show_stop()
+            session, ip = self.locate(params['ip'])
+            self.move_ip(session, ip)
         elif cmd == 'vtable':
-            ip = params['ip'] + self.bv.start
-            target = params['target'] + self.bv.start
-            object = params['object'] + self.bv.start if 'object' in params else None
-            instr = params['instr']
-            self.vtable(ip, target, object, instr)
+            session, ip = self.locate(params['ip'])
+            if session:
+                session.vtable(ip, params['target'], params.get('object'),
+                    params['instr'])
+        elif cmd == 'vtable_visits':
+            self.vtable_visits(params['ips'], params['targets'],
+                params['counts'])
+
+
+    def update_module_bases(self):
+        for session in self.views.values():
+            mod = self.modules.find(session.module_name) \
+                if self.modules_synced else None
+            session.module_base = mod.base if mod else None
+
+
+    def locate(self, target_addr):
+        """Maps a debugger address to (session, address in its view), or
+        (None, None) if no open view covers it"""
+        mod = self.modules.lookup(target_addr)
+        session = self.views.get(mod.name) if mod else None
+        if not session:
+            return None, None
+        addr = target_addr - mod.base + session.bv.start
+        if not session.bv.is_valid_offset(addr):
+            return None, None
+        return session, addr
+
 
+    def to_target(self, addr):
+        """Maps an address in this view to the debugger, or None if the
+        module isn't loaded"""
+        if self.module_base is None:
+            print("{} isn't loaded in the target".format(self.module_name))
+            return None
+        return addr - self.bv.start + self.module_base
 
-    def highlight(self, addr, color):
-        func = self.bv.get_functions_containing(addr)[0]
-        func.set_auto_instr_highlight(addr, color)
+
+    def describe(self, target_addr):
+        """Names a debugger address for comments, using symbols from whichever
+        view covers it"""
+        session, addr = self.primary.locate(target_addr)
+        if session:
+            name = session.symbols.lookup(addr)
+            if name:
+                return name
+        return self.primary.modules.describe(target_addr)
+
+
+    def update_stack(self, keep, frames):
+        del self.stack[keep:]
+        self.stack.extend(frames)
+        if not self.stack_dock:
+            self.stack_dock = StackDockWidget(get_toolbar(), self.goto_frame)
+            self.stack_dock.show()
+        self.stack_dock.update_frames(keep,
+            [self.frame_label(ip) for ip in frames])
+
+
+    def frame_label(self, target_addr):
+        # frames outside every view are labelled from the module table
+        session, addr = self.locate(target_addr)
+        func = session.functions.lookup(addr) if session else None
+        if func:
+            return '{}!{}+{:#x}'.format(session.module_name, func.name,
+                addr - func.start)
+        return self.modules.describe(target_addr)
+
+
+    def goto_frame(self, index):
+        session, addr = self.locate(self.stack[index])
+        if session:
+            session.bv.navigate(session.bv.view, addr)
+
+
+    def move_ip(self, session, addr, hit=False):
+        # the IP may have left this view for another one, or for a module
+        # that isn't open in Binja at all
+        if self.ip_session and self.ip_session is not session:
+            self.ip_session.clear_ip()
+        self.ip_session = session
+        if session and hit:
+            session.bp_hit(addr, self.regs)
+        elif session:
+            session.set_ip(addr, self.regs)
+
+
+    def fetch_pages(self, pages):
+        """Requests target memory pages and waits for the reply"""
+        if self.replay:
+            return      # only the pages in the log can be read
+        event = threading.Event()
+        with self.dispatch_lock:
+            id = self.next_request
+            self.next_request += 1
+            self.page_requests[id] = (self.memory.generation, event)
+        self.send('read_pages', id=id, pages=pages)
+        event.wait(memory_timeout)
+        with self.dispatch_lock:
+            self.page_requests.pop(id, None)
+
+
+    def pages(self, id, pages, data):
+        with self.dispatch_lock:
+            request = self.page_requests.get(id)
+        if request:
+            generation, event = request
+            self.memory.fill(generation, zip(pages, data))
+            event.set()
+        elif self.replay:
+            self.memory.fill(self.memory.generation, zip(pages, data))
+
+
+    def read_memory(self, addr, size):
+        """Reads size bytes at an address in this view from the target"""
+        target_addr = self.to_target(addr)
+        if target_addr is None:
+            return None
+        return self.primary.memory.read(target_addr, size,
+            self.primary.fetch_pages)
+
+
+    def update_regs(self, regs, full=False, ip=None):
+        # the debugger sends a full snapshot on sync and only the registers
+        # that changed on every stop after that
+        if full:
+            self.regs = dict(regs)
+        else:
+            self.regs.update(regs)
+        if ip is not None:
+            self.history.record(ip, self.regs)
+
+
+    def show_stop(self, stop=None):
+        """Shows the registers at a recorded stop, the newest one by default.
+        Everything comes from the history, so scrubbing never queries the
+        debugger."""
+        if not len(self.history):
+            return
+        if stop is None:
+            stop = self.history.last_stop()
+        if not self.regs_dock:
+            self.regs_dock = RegistersDockWidget(get_toolbar(), self.scrub)
+            self.regs_dock.show()
+        ip, regs = self.history.get(stop)
+        self.regs_dock.show_stop(stop, self.history.first(),
+            self.history.last_stop(), self.describe(ip), regs,
+            self.history.changed(stop))
+
+
+    def scrub(self, stop):
+        self.show_stop(stop)
+        ip, regs = self.history.get(stop)
+        session, addr = self.locate(ip)
+        if session:
+            session.bv.navigate(session.bv.view, addr)
 
 
     def set_ip(self, addr, regs=None, came_from_binja=False):
         if came_from_binja:
-            self.send('set_ip', ip=addr-self.bv.start)
+            target_addr = self.to_target(addr)
+            if target_addr is None:
+                return
+            self.send('set_ip', ip=target_addr)
 
+        # whatever was under the old IP (e.g. a breakpoint) shows again
+        highlights = self.highlights
         if self.ip:
-            self.highlight(self.ip, no_color)
-        self.highlight(addr, ip_color)
+            highlights.discard('ip', self.ip)
+        highlights.clear('hit')
+        highlights.clear('branch')
+        highlights.set('ip', addr, ip_color)
         self.ip = addr
-        self.bv.navigate(self.bv.view, addr)    # "go to address" equivalent
-        
+
         # highlight the target of a branch instruction
-        func = self.bv.get_functions_containing(addr)[0]
-        il_instr = func.get_lifted_il_at(addr)
-        if il_instr.operation != LowLevelILOperation.LLIL_IF or not regs:
+        decoded = self.decode_branch(addr) if regs else None
+        if decoded:
+            highlights.set('branch', branch.next_ip(decoded, regs),
+                cond_jump_color)
+        highlights.flush()
+        self.bv.navigate(self.bv.view, addr)    # "go to address" equivalent
+
+        if self.overlay:
+            self.update_overlay(addr)
+
+
+    def clear_ip(self):
+        if self.ip:
+            self.highlights.discard('ip', self.ip)
+            self.highlights.clear('hit')
+            self.highlights.clear('branch')
+            self.highlights.flush()
+            self.ip = None
+
+
+    def get_data_refs(self, func):
+        try:
+            return self.data_refs[func.start]
+        except KeyError:
+            data_vars = self.bv.data_vars
+            refs = set()
+            for tokens, addr in func.instructions:
+                for ref in func.get_constants_referenced_by(addr):
+                    if ref.value in data_vars:
+                        refs.add(ref.value)
+            self.data_refs[func.start] = sorted(refs)
+            return self.data_refs[func.start]
+
+
+    def update_overlay(self, ip):
+        """Comments the live value of every data variable the current
+        function references"""
+        func = self.functions.lookup(ip)
+        if not func or self.module_base is None:
             return
-        instr, jump = self.bv.get_disassembly(addr).split()
-        if ((instr in ('jo') and regs['of'] == 1) or
-            (instr in ('jno') and regs['of'] == 0) or
-            (instr in ('js') and regs['sf'] == 1) or
-            (instr in ('jns') and regs['sf'] == 0) or
-            (instr in ('je','jz') and regs['zf'] == 1) or
-            (instr in ('jne') and regs['zf'] == 0) or
-            (instr in ('jb','jnae','jc') and regs['cf'] == 1) or
-            (instr in ('jnb','jae','jnc') and regs['cf'] == 0) or
-            (instr in ('jbe','jna') and (regs['cf'] == 1 or regs['zf'] == 1)) or
-            (instr in ('ja','jnbe') and regs['cf'] == 0 and regs['zf'] == 0) or
-            (instr in ('jl','jnge') and regs['sf'] != regs['of']) or
-            (instr in ('jge','jnl') and regs['sf'] == regs['of']) or
-            (instr in ('jle','jng') and (regs['zf'] == 1 or regs['sf'] != regs['of'])) or
-            (instr in ('jg','jnle') and regs['zf'] == 0 and regs['sf'] == 0) or
-            (instr in ('jp','jpe') and regs['pf'] == 1) or
-            (instr in ('jnp','jpo') and regs['pf'] == 1) or
-            (instr in ('jcxz','jecxz') and regs['cx'] == 0)):
-            target = int(jump, 16)
-        else:
-            target = addr + self.bv.get_instruction_length(addr)
-        self.highlight(target, cond_jump_color)
 
+        reads = []
+        for addr in self.get_data_refs(func):
+            width = self.bv.data_vars[addr].type.width
+            if width in value_formats:
+                reads.append((addr, width))
+        # one round trip for every page the overlay needs
+        self.primary.memory.prefetch(
+            [(self.to_target(addr), width) for addr, width in reads],
+            self.primary.fetch_pages)
+
+        for addr, width in reads:
+            data = self.read_memory(addr, width)
+            if data is None:
+                continue
+            value = struct.unpack(value_formats[width], data)[0]
+            live = 'live: {:#x}'.format(value)
+            if width == self.bv.arch.address_size and \
+                    self.primary.modules.lookup(value):
+                live += ' -> ' + self.describe(value)
 
-    def set_bp(self, addr, came_from_binja=False):
+            # the live value goes under the user's own comment, which is
+            # put back when the overlay is turned off
+            current = self.bv.get_comment_at(addr)
+            user_comment, shown = self.overlay_comments.get(addr, ('', None))
+            if current != shown:
+                user_comment = current  # first write, or edited since
+            comment = '\n'.join(line for line in (user_comment, live) if line)
+            if comment != current:
+                self.bv.set_comment_at(addr, comment)
+            self.overlay_comments[addr] = (user_comment, comment)
+
+
+    def clear_overlay(self):
+        for addr, (user_comment, shown) in self.overlay_comments.items():
+            # a comment edited while the overlay was on is the user's now
+            if self.bv.get_comment_at(addr) == shown:
+                self.bv.set_comment_at(addr, user_comment)
+        self.overlay_comments.clear()
+
+
+    def toggle_overlay(self):
+        self.overlay = not self.overlay
+        if self.overlay and self.ip:
+            self.update_overlay(self.ip)
+        elif not self.overlay:
+            self.clear_overlay()
+
+
+    def decode_branch(self, addr):
+        try:
+            return self.branches[addr]
+        except KeyError:
+            decoded = branch.decode(self.bv.get_disassembly(addr), addr,
+                self.bv.get_instruction_length(addr))
+            self.branches[addr] = decoded
+            return decoded
+
+
+    def set_bp(self, addr, came_from_binja=False, **rule):
+        """rule is evaluated by the debugger on every hit: condition (WinDbg
+        expression), hit_count and log (expressions to sample instead of
+        stopping)"""
         if came_from_binja:
-            self.send('set_bp', addr=addr-self.bv.start)
+            target_addr = self.to_target(addr)
+            if target_addr is None:
+                return
+            self.send('set_bp', addr=target_addr, **rule)
+            if rule:
+                self.bp_rules[addr] = rule
+            else:
+                self.bp_rules.pop(addr, None)
+            self.bps_dirty = True
+
+        if addr not in self.bps:
+            self.bps.add(addr)
+            self.bps_dirty = True
+        self.highlights.set('breakpoint', addr, enabled_bp_color)
+        self.highlights.flush()
+        if came_from_binja:
+            self.save_state()
 
-        self.bps.add(addr)
-        self.highlight(addr, enabled_bp_color)
-        
 
     def delete_bp(self, addr, came_from_binja=False):
         if addr not in self.bps:
             return
 
         if came_from_binja:
-            self.send('delete_bp', addr=addr-self.bv.start)
+            target_addr = self.to_target(addr)
+            if target_addr is None:
+                return
+            self.send('delete_bp', addr=target_addr)
 
         self.bps.remove(addr)
-        self.highlight(addr, no_color)
-    
-    
+        self.bp_rules.pop(addr, None)
+        self.bps_dirty = True
+        self.highlights.discard('breakpoint', addr)
+        self.highlights.flush()
+        if came_from_binja:
+            self.save_state()
+
+
+    def set_bps(self, addrs):
+        if self.module_base is None:
+            self.to_target(0)   # reports the module isn't loaded
+            return
+        addrs = [addr for addr in addrs if addr not in self.bps]
+        self.send('set_bps', addrs=[self.to_target(addr) for addr in addrs])
+        print("Setting {} breakpoints".format(len(addrs)))
+
+
+    def delete_bps(self, addrs):
+        if self.module_base is None:
+            return
+        addrs = [addr for addr in addrs if addr in self.bps]
+        self.send('delete_bps', addrs=[self.to_target(addr) for addr in addrs])
+
+
+    def reconcile_bps(self, target_addrs):
+        """Merges the debugger's breakpoints, sent on sync, with the ones
+        Binja has: the debugger's are adopted, and the ones only Binja has
+        (e.g. restored from metadata) are pushed back to it"""
+        in_debugger = { }
+        for target_addr in target_addrs:
+            session, addr = self.locate(target_addr)
+            if session:
+                session.set_bp(addr)
+                in_debugger.setdefault(session, set()).add(addr)
+
+        for session in list(self.views.values()):
+            if session.module_base is None:
+                continue
+            missing = session.bps - in_debugger.get(session, set())
+            plain = [addr for addr in missing if addr not in session.bp_rules]
+            if plain:
+                session.send('set_bps',
+                    addrs=[session.to_target(addr) for addr in plain])
+            # WinDbg's workspace only keeps plain breakpoints, so rules are
+            # resent even for breakpoints it still has
+            for addr, rule in session.bp_rules.items():
+                session.send('set_bp', addr=session.to_target(addr), **rule)
+
+
+    def bps_result(self, cmd, target_addrs, ok):
+        failed = 0
+        for target_addr, success in zip(target_addrs, ok):
+            session, addr = self.locate(target_addr)
+            if not success:
+                failed += 1
+            elif not session:
+                continue
+            elif cmd == 'set_bps':
+                session.set_bp(addr)
+            else:
+                session.delete_bp(addr)
+        if failed:
+            print("{} of {} breakpoints failed".format(failed, len(target_addrs)))
+
+
+    def start_coverage(self):
+        if self.module_base is None:
+            self.to_target(0)   # reports the module isn't loaded
+            return
+        if self.primary.coverage_session and self.primary.coverage_session is not self:
+            self.primary.coverage_session.stop_coverage()
+        if not self.coverage:
+            self.coverage = Coverage(self.bv, self.highlights)
+        self.primary.coverage_session = self
+        self.send('start_coverage',
+            addrs=[self.to_target(addr) for addr in self.coverage.addrs()])
+
+
+    def stop_coverage(self):
+        self.send('stop_coverage')
+        if self.coverage:
+            print(self.coverage.summary())
+
+
+    def clear_coverage(self):
+        if self.primary.coverage_session is self:
+            self.stop_coverage()
+            self.primary.coverage_session = None
+        if self.coverage:
+            self.coverage.clear()
+            self.coverage = None
+
+
+    def record_trace(self, steps):
+        path = os.path.splitext(self.bv.file.filename)[0] + '.trace'
+        # Windows won't let the debugger truncate a file that's still mapped
+        primary = self.primary
+        if primary.trace:
+            primary.trace.close()
+            primary.trace = None
+        self.send('record_trace', path=path, steps=steps,
+            capacity=trace_capacity, regs=trace_regs[self.bv.arch.name])
+
+
+    def load_trace(self):
+        # traces can be huge, so only map the file once it's needed
+        primary = self.primary
+        if not primary.trace and primary.trace_path:
+            primary.trace = TraceReader(primary.trace_path)
+        return primary.trace
+
+
+    def show_trace(self):
+        trace = self.load_trace()
+        if not trace:
+            print("No trace has been recorded")
+            return
+
+        hits = { }
+        branches = { }
+        for ip, taken, regs in trace:
+            session, addr = self.primary.locate(ip)
+            if session is not self:
+                continue
+            hits[addr] = hits.get(addr, 0) + 1
+            if self.decode_branch(addr):
+                taken_count, total = branches.get(addr, (0, 0))
+                branches[addr] = (taken_count + taken, total + 1)
+
+        # heat map from yellow (hit once) to red (hottest instruction)
+        scale = math.log(max(hits.values())) if hits else 0
+        self.highlights.clear('trace')
+        for addr, count in hits.items():
+            mix = int(255 * math.log(count) / scale) if scale else 0
+            self.highlights.set('trace', addr, HighlightColor(
+                HighlightStandardColor.YellowHighlightColor,
+                HighlightStandardColor.RedHighlightColor, mix))
+        self.highlights.flush()
+
+        # under the user's comment, replacing only what an earlier trace added
+        for addr, (taken_count, total) in branches.items():
+            func = self.functions.lookup(addr)
+            if func:
+                func.set_comment_at(addr, merge_comment(func.get_comment_at(addr),
+                    taken_line_regex, ['taken {}/{}'.format(taken_count, total)]))
+        print("Trace covers {} instructions, {} unique in {}".format(len(trace),
+            len(hits), self.module_name))
+
+
+    def log_samples(self, addrs, hits, values):
+        touched = set()
+        for target_addr, hit, sample in zip(addrs, hits, values):
+            session, addr = self.locate(target_addr)
+            if not session:
+                continue
+            exprs = session.bp_rules.get(addr, { }).get('log') or \
+                [''] * len(sample)
+            line = '#{} '.format(hit) + ' '.join('{}={:#x}'.format(e, value)
+                for e, value in zip(exprs, sample))
+            lines = session.log_lines.setdefault(addr, [])
+            lines.append(line.strip())
+            del lines[:-log_comment_lines]
+            touched.add((session, addr))
+
+        # one comment update per log point per batch
+        for session, addr in touched:
+            func = session.functions.lookup(addr)
+            if not func:
+                continue
+            current = func.get_comment_at(addr)
+            comment = merge_comment(current, log_line_regex,
+                session.log_lines[addr])
+            if comment != current:
+                func.set_comment_at(addr, comment)
+
+
+    def step(self, mode, limit=step_limit, over=False, **params):
+        self.send('step', mode=mode, limit=limit, over=over, summary=True,
+            **params)
+
+
+    def step_done(self, steps, reason, blocks, hits):
+        print("Stepped {} instructions, stopped by {}".format(steps, reason))
+        if not blocks:
+            return
+        entered = sorted(zip(hits, blocks), reverse=True)
+        print("Entered {} blocks, most often:".format(len(entered)))
+        for count, addr in entered[:step_summary_blocks]:
+            print("  {:>8}  {}".format(count, self.describe(addr)))
+
+
     def bp_hit(self, addr, regs=None):
         self.set_ip(addr, regs=regs)
-        self.highlight(addr, hit_bp_color)
-    
-    
+        self.highlights.set('hit', addr, hit_bp_color)
+        self.highlights.flush()
+
+
     def vtable(self, ip, target, object, instr):
-        target_sym = self.bv.get_symbol_at(target)
-        target_sym = target_sym.full_name if target_sym else str(target)
-        if object:
-            object_sym = self.bv.get_symbol_at(object)
-            object_sym = object_sym.full_name.split("::")[0] if object_sym else str(object)
+        # visits are counted by vtable_visits, which the debugger sends after
+        # this; the comment only lists targets, so it can't change for a repeat
+        targets = self.call_targets.setdefault(ip, { })
+        if target in targets:
+            return
+        targets[target] = 0
+
+        target_sym = self.describe(target)
+        if object is not None:
+            object_sym = self.describe(object).split("::")[0]
             comment = '{} (from {} object)'.format(target_sym, object_sym)
             if instr == 'lea':
                 comment = '(ptr)' + comment
         else:
             comment = target_sym
-        self.bv.get_functions_containing(ip)[0].set_comment_at(ip, comment)
-        
+        comments = self.call_comments.setdefault(ip, [])
+        # an earlier session may have commented this target already
+        if comment not in comments:
+            comments.append(comment)
+            func = self.functions.lookup(ip)
+            if func:
+                func.set_comment_at(ip, '\n'.join(comments))
+                session, target_addr = self.primary.locate(target)
+                if instr == 'call' and session is self:
+                    # lets static analysis follow the dynamic call graph
+                    func.add_user_code_ref(ip, target_addr)
+
+
+    def vtable_visits(self, ips, targets, counts):
+        for target_ip, target, count in zip(ips, targets, counts):
+            session, ip = self.locate(target_ip)
+            if not session:
+                continue
+            site = session.call_targets.setdefault(ip, { })
+            site[target] = site.get(target, 0) + count
+            # written with the rest of the batch by save_state
+            session.call_targets_dirty = True
+
+
+    def save_call_targets(self):
+        # call sites are stored as offsets from the view start and targets as
+        # module+offset, so both survive ASLR, and counts are added to the
+        # ones saved by earlier sessions
+        modules = self.primary.modules
+        saved = dict((ip, dict(targets))
+            for ip, targets in self.saved_call_targets.items())
+        for ip, targets in self.call_targets.items():
+            counts = saved.setdefault('{:#x}'.format(ip - self.bv.start), { })
+            for target, count in targets.items():
+                name = modules.describe(target)
+                counts[name] = counts.get(name, 0) + count
+        self.bv.store_metadata('bindbg.call_targets', saved)
+
+
+    def save_state(self):
+        """Writes what changed since the last call to the view's metadata, so
+        a restarted session can show it before the debugger answers"""
+        if self.primary.replay:
+            return      # a replay mustn't overwrite the live session's state
+        if self.bps_dirty:
+            # offsets from the view start survive rebasing
+            self.bv.store_metadata('bindbg.bps', dict(
+                ('{:#x}'.format(addr - self.bv.start), self.bp_rules.get(addr, { }))
+                for addr in self.bps))
+            self.bps_dirty = False
+        if self.call_targets_dirty:
+            self.save_call_targets()
+            self.call_targets_dirty = False
+        if self.primary is self and self.modules_dirty:
+            layout = [[mod.name, mod.base, mod.end] for mod in self.modules]
+            for session in self.views.values():
+                session.bv.store_metadata('bindbg.modules', layout)
+            self.modules_dirty = False
+
+
+    def restore_state(self):
+        """Shows the breakpoints and call targets the last session on this
+        view saved; sync then reconciles them with the debugger"""
+        settings = query_metadata(self.bv, 'bindbg.settings', { })
+        for key in ('pipe', 'proc_args'):
+            if key in settings and key not in self.bv.session_data:
+                self.bv.session_data[key] = settings[key]
+
+        for offset, rule in query_metadata(self.bv, 'bindbg.bps', { }).items():
+            addr = self.bv.start + int(offset, 16)
+            self.bps.add(addr)
+            if rule:
+                self.bp_rules[addr] = dict(rule)
+            self.highlights.set('breakpoint', addr, enabled_bp_color)
+        self.highlights.flush()
+
+        # the comments themselves are saved in the bndb already; only the
+        # lines are needed so new targets are appended to them
+        self.saved_call_targets = query_metadata(self.bv,
+            'bindbg.call_targets', { })
+        for offset in self.saved_call_targets:
+            ip = self.bv.start + int(offset, 16)
+            func = self.functions.lookup(ip)
+            comment = func.get_comment_at(ip) if func else None
+            if comment:
+                self.call_comments[ip] = comment.split('\n')
+
+
+    def restore_modules(self):
+        # the last known layout only labels addresses until sync sends the
+        # real one; ASLR has most likely moved the modules since
+        for name, base, end in query_metadata(self.bv, 'bindbg.modules', []):
+            self.modules.add(base, end, name)
+
+
+def merge_comment(comment, ours, lines):
+    """Replaces the lines of comment that ours matches with lines, under the
+    rest, which are the user's"""
+    kept = [line for line in comment.split('\n')
+        if not ours.match(line)] if comment else []
+    return '\n'.join(kept + lines)
+
+
+def query_metadata(bv, key, default):
+    try:
+        return bv.query_metadata(key)
+    except KeyError:
+        return default
+
+
+def save_settings(bv):
+    bv.store_metadata('bindbg.settings', {
+        'pipe': bv.session_data.get('pipe') or '',
+        'proc_args': bv.session_data.get('proc_args') or '',
+    })
+
 
 def get_hwnds_for_pid(pid):
+    import win32gui
+    import win32process
+
     def callback(hwnd, hwnds):
         if win32gui.IsWindowVisible(hwnd) and win32gui.IsWindowEnabled(hwnd):
             _, found_pid = win32process.GetWindowThreadProcessId(hwnd)
@@ -257,11 +1132,21 @@ def get_hwnds_for_pid(pid):
 
 def start(bv):
     if 'bindbg' not in bv.session_data:
-        bv.session_data['bindbg'] = BinDbgSession(bv)
+        primaries.add(BinDbgSession(bv))
     else:
         print("This BinaryView is already being debugged")
 
 
+def attach(bv):
+    if 'bindbg' in bv.session_data:
+        print("This BinaryView is already being debugged")
+    elif not primaries:
+        print("No BinDbg session is running")
+    else:
+        primary = next(iter(primaries))
+        BinDbgSession(bv, primary=primary)
+
+
 def stop(bv):
     try:
         bv.session_data['bindbg'].stop("BinDbg session closed by user")
@@ -276,6 +1161,41 @@ def set_bp(bv, addr):
         print("This BinaryView is not being debugged")
 
 
+def set_conditional_bp(bv, addr):
+    if 'bindbg' not in bv.session_data:
+        print("This BinaryView is not being debugged")
+        return
+
+    condition = get_text_line_input("WinDbg expression to break on (e.g. @ecx == 0):",
+        "Set conditional breakpoint")
+    if condition:
+        bv.session_data['bindbg'].set_bp(addr, came_from_binja=True,
+            condition=condition)
+
+
+def set_hit_count_bp(bv, addr):
+    if 'bindbg' not in bv.session_data:
+        print("This BinaryView is not being debugged")
+        return
+
+    hit_count = get_int_input("Break on hit number:", "Set hit count breakpoint")
+    if hit_count:
+        bv.session_data['bindbg'].set_bp(addr, came_from_binja=True,
+            hit_count=hit_count)
+
+
+def set_log_point(bv, addr):
+    if 'bindbg' not in bv.session_data:
+        print("This BinaryView is not being debugged")
+        return
+
+    exprs = get_text_line_input("WinDbg expressions to log (e.g. @ecx, poi(@esp+4)):",
+        "Set log point")
+    if exprs:
+        exprs = [e.strip() for e in exprs.split(',') if e.strip()]
+        bv.session_data['bindbg'].set_bp(addr, came_from_binja=True, log=exprs)
+
+
 def delete_bp(bv, addr):
     try:
         bv.session_data['bindbg'].delete_bp(addr, came_from_binja=True)
@@ -283,6 +1203,108 @@ def delete_bp(bv, addr):
         print("This BinaryView is not being debugged")
 
 
+def set_bps_on_functions(bv):
+    try:
+        bv.session_data['bindbg'].set_bps([func.start for func in bv.functions])
+    except KeyError:
+        print("This BinaryView is not being debugged")
+
+
+def set_bps_on_callers(bv):
+    if 'bindbg' not in bv.session_data:
+        print("This BinaryView is not being debugged")
+        return
+
+    name = get_text_line_input("Enter symbol name:", "Set breakpoints on callers")
+    sym = bv.get_symbol_by_raw_name(name) if name else None
+    if not sym:
+        print("Symbol {} not found".format(name))
+        return
+    refs = bv.get_code_refs(sym.address)
+    bv.session_data['bindbg'].set_bps([ref.address for ref in refs])
+
+
+def set_bps_on_blocks(bv, func):
+    try:
+        bv.session_data['bindbg'].set_bps([block.start for block in func.basic_blocks])
+    except KeyError:
+        print("This BinaryView is not being debugged")
+
+
+def delete_all_bps(bv):
+    try:
+        session = bv.session_data['bindbg']
+        session.delete_bps(list(session.bps))
+    except KeyError:
+        print("This BinaryView is not being debugged")
+
+
+def start_coverage(bv):
+    try:
+        bv.session_data['bindbg'].start_coverage()
+    except KeyError:
+        print("This BinaryView is not being debugged")
+
+
+def stop_coverage(bv):
+    try:
+        bv.session_data['bindbg'].stop_coverage()
+    except KeyError:
+        print("This BinaryView is not being debugged")
+
+
+def clear_coverage(bv):
+    session = bv.session_data.get('bindbg')
+    if session:
+        session.clear_coverage()
+        return
+    # coverage outlives the session that recorded it, and only coverage
+    # highlights whole blocks
+    for func in bv.functions:
+        for block in func.basic_blocks:
+            block.set_auto_highlight(HighlightStandardColor.NoHighlightColor)
+
+
+def export_coverage(bv):
+    try:
+        coverage = bv.session_data['bindbg'].coverage
+    except KeyError:
+        print("This BinaryView is not being debugged")
+        return
+    if not coverage:
+        print("No coverage has been recorded")
+        return
+
+    path = get_save_filename_input("Export coverage as drcov", "log")
+    if path:
+        coverage.export_drcov(path, bv.file.filename.replace('.bndb', '.exe'))
+        print("Exported coverage to {}".format(path))
+
+
+def record_trace(bv):
+    if 'bindbg' not in bv.session_data:
+        print("This BinaryView is not being debugged")
+        return
+
+    steps = get_int_input("Number of instructions to record:", "Record trace")
+    if steps:
+        bv.session_data['bindbg'].record_trace(steps)
+
+
+def show_trace(bv):
+    try:
+        bv.session_data['bindbg'].show_trace()
+    except KeyError:
+        print("This BinaryView is not being debugged")
+
+
+def toggle_overlay(bv):
+    try:
+        bv.session_data['bindbg'].toggle_overlay()
+    except KeyError:
+        print("This BinaryView is not being debugged")
+
+
 def set_ip(bv, addr):
     try:
         bv.session_data['bindbg'].set_ip(addr, came_from_binja=True)
@@ -292,7 +1314,10 @@ def set_ip(bv, addr):
 
 def run_to(bv, addr):
     try:
-        bv.session_data['bindbg'].send('run_to', addr=addr-bv.start)
+        session = bv.session_data['bindbg']
+        target_addr = session.to_target(addr)
+        if target_addr is not None:
+            session.send('run_to', addr=target_addr)
     except KeyError:
         print("This BinaryView is not being debugged")
 
@@ -305,10 +1330,12 @@ def go(bv):
         
 
 def break_(bv):
+    import win32com.client
+    import win32gui
     try:
         shell = win32com.client.Dispatch('WScript.Shell')
         # focus on windbg (avoid AppActivate as it leaves windbg in foreground)
-        hwnd = get_hwnds_for_pid(bv.session_data['bindbg'].windbg_proc.pid)[0]
+        hwnd = get_hwnds_for_pid(bv.session_data['bindbg'].primary.windbg_proc.pid)[0]
         win32gui.SetForegroundWindow(hwnd)
         # send break sequence to transfer control back to debugger
         shell.SendKeys('^{BREAK}')
@@ -340,25 +1367,193 @@ def step_over(bv):
         print("This BinaryView is not being debugged")
 
 
+def toggle_stats(bv):
+    try:
+        session = bv.session_data['bindbg']
+    except KeyError:
+        print("This BinaryView is not being debugged")
+        return
+
+    stats = session.primary.stats
+    if stats.enabled:
+        stats.enabled = False
+        session.send('stats', action='disable')
+        print("Message stats disabled")
+    else:
+        stats.reset()
+        stats.enabled = True
+        session.send('stats', action='enable')
+        print("Message stats enabled")
+
+
+def show_stats(bv):
+    try:
+        session = bv.session_data['bindbg']
+    except KeyError:
+        print("This BinaryView is not being debugged")
+        return
+
+    print("Binary Ninja side:\n" + session.primary.stats.summary())
+    # the debugger prints its half through a 'print' message
+    session.send('stats', action='show')
+
+
+def export_stats(bv):
+    try:
+        session = bv.session_data['bindbg']
+    except KeyError:
+        print("This BinaryView is not being debugged")
+        return
+
+    path = get_save_filename_input("Export message stats", "csv")
+    if path:
+        try:
+            session.primary.stats.export(path)
+        except (IOError, OSError) as e:
+            print("Can't export stats to {}: {}".format(path, e))
+            return
+        windbg_path = os.path.splitext(path)[0] + '.windbg.csv'
+        session.send('stats', action='export', path=windbg_path)
+        print("Exported message stats to {} and {}".format(path, windbg_path))
+
+
+def record_session_log(bv):
+    try:
+        session = bv.session_data['bindbg']
+    except KeyError:
+        print("This BinaryView is not being debugged")
+        return
+
+    primary = session.primary
+    if primary.session_log:
+        primary.update_session_log(None)
+        session.send('session_log', path=None)
+        print("Stopped recording session log")
+        return
+
+    path = get_save_filename_input("Record session log", "bdlog")
+    if path:
+        try:
+            primary.update_session_log(path)
+        except (IOError, OSError) as e:
+            print("Can't record session log to {}: {}".format(path, e))
+            return
+        windbg_path = os.path.splitext(path)[0] + '.windbg.bdlog'
+        session.send('session_log', path=windbg_path)
+        print("Recording session log to {} and {}".format(path, windbg_path))
+
+
+def replay_session_log(bv):
+    if 'bindbg' in bv.session_data:
+        print("This BinaryView is already being debugged")
+        return
+
+    path = get_open_filename_input("Replay session log", "*.bdlog")
+    if not path:
+        return
+    speed = get_choice_input("Replay speed", "Replay session log",
+        ["Full speed", "Original timing"])
+    if speed is None:
+        return
+    primaries.add(BinDbgSession(bv, replay=(path, speed == 1)))
+
+
+def step_count(bv):
+    if 'bindbg' not in bv.session_data:
+        print("This BinaryView is not being debugged")
+        return
+
+    steps = get_int_input("Number of instructions to step:", "Step N instructions")
+    if steps:
+        bv.session_data['bindbg'].step('count', limit=steps)
+
+
+def step_until_branch(bv):
+    try:
+        bv.session_data['bindbg'].step('branch')
+    except KeyError:
+        print("This BinaryView is not being debugged")
+
+
+def step_until_return(bv):
+    try:
+        bv.session_data['bindbg'].step('return', over=True)
+    except KeyError:
+        print("This BinaryView is not being debugged")
+
+
+def step_until_leave(bv, func):
+    try:
+        session = bv.session_data['bindbg']
+    except KeyError:
+        print("This BinaryView is not being debugged")
+        return
+
+    ranges = []
+    for block in func.basic_blocks:
+        start = session.to_target(block.start)
+        if start is None:
+            return
+        ranges.append([start, start + block.length])
+    session.step('leave', over=True, ranges=ranges)
+
+
+def step_until_condition(bv):
+    if 'bindbg' not in bv.session_data:
+        print("This BinaryView is not being debugged")
+        return
+
+    condition = get_text_line_input("WinDbg expression to stop at (e.g. @eax == 0):",
+        "Step until condition")
+    if condition:
+        bv.session_data['bindbg'].step('condition', condition=condition)
+
+
 def set_args(bv):
     bv.session_data['proc_args'] = get_text_line_input(
         "Enter process arguments:",
         "Set process arguments"
     )
+    save_settings(bv)
 
 
 def sync(bv):
     try:
-        bv.session_data['bindbg'].send('sync')
+        bv.session_data['bindbg'].send('sync', version=protocol.VERSION)
     except KeyError:
         print("This BinaryView is not being debugged")
 
 
 PluginCommand.register_for_address("Set breakpoint", "", set_bp)
+PluginCommand.register_for_address("Set conditional breakpoint", "", set_conditional_bp)
+PluginCommand.register_for_address("Set hit count breakpoint", "", set_hit_count_bp)
+PluginCommand.register_for_address("Set log point", "", set_log_point)
 PluginCommand.register_for_address("Delete breakpoint", "", delete_bp)
 PluginCommand.register_for_address("Set instruction ptr", "", set_ip)
+PluginCommand.register_for_function("Set breakpoints on all blocks in function", "", set_bps_on_blocks)
+PluginCommand.register("Set breakpoints on all functions", "", set_bps_on_functions)
+PluginCommand.register("Set breakpoints on all callers of symbol", "", set_bps_on_callers)
+PluginCommand.register("Delete all breakpoints", "", delete_all_bps)
+PluginCommand.register("Start coverage", "", start_coverage)
+PluginCommand.register("Stop coverage", "", stop_coverage)
+PluginCommand.register("Clear coverage", "", clear_coverage)
+PluginCommand.register("Export coverage as drcov", "", export_coverage)
+PluginCommand.register("Toggle live data overlay", "", toggle_overlay)
+PluginCommand.register("Record trace", "", record_trace)
+PluginCommand.register("Show recorded trace", "", show_trace)
 PluginCommand.register_for_address("Run to cursor", "", run_to)
+PluginCommand.register("Step N instructions", "", step_count)
+PluginCommand.register("Step until branch taken", "", step_until_branch)
+PluginCommand.register("Step until return", "", step_until_return)
+PluginCommand.register_for_function("Step until leaving function", "", step_until_leave)
+PluginCommand.register("Step until condition", "", step_until_condition)
+PluginCommand.register("Toggle message stats", "", toggle_stats)
+PluginCommand.register("Show message stats", "", show_stats)
+PluginCommand.register("Export message stats", "", export_stats)
+PluginCommand.register("Record session log", "", record_session_log)
+PluginCommand.register("Replay session log", "", replay_session_log)
 PluginCommand.register("Start BinDbg session", "", start)
+PluginCommand.register("Attach view to BinDbg session", "", attach)
 PluginCommand.register("Stop BinDbg session", "", stop)
 PluginCommand.register("Set process arguments", "", set_args)
 PluginCommand.register("Sync with debugger", "", sync)
@@ -0,0 +1,796 @@
+"""
+Benchmarks of BinDbg, runnable without WinDbg or Binja.
+
+The protocol benchmarks simulate both ends at the message level only: a child
+process stands in for the WinDbg extension and answers with the same messages
+and payload shapes windbg.py sends, over a real multiprocessing Pipe.
+
+The simulated benchmarks run the real code of both ends instead, with the
+stand-ins for pykd, Binja and PyQt5 in sim/: windbg.py in a child process
+driving a simulated target, and a BinDbgSession on a simulated BinaryView,
+connected over a local socket in place of the named pipe. They need Python 3.
+
+Results are written as JSON so runs against different revisions can be
+diffed.
+
+    python bench.py [output.json]
+"""
+
+from multiprocessing import Event, Pipe, Process
+from multiprocessing.connection import Client, Listener
+import contextlib
+import ctypes
+import json
+import multiprocessing.connection
+import os
+import random
+import sys
+import tempfile
+import threading
+
+from memory import PageCache, page_size
+from modules import ModuleTable
+from stats import clock
+import protocol
+import tracefile
+
+try:
+    import tracemalloc
+except ImportError:     # Python 2
+    tracemalloc = None
+
+steps = 2000
+messages = 20000
+bp_counts = [100, 1000, 10000]
+x64_regs = ['rax', 'rbx', 'rcx', 'rdx', 'rsi', 'rdi', 'rbp', 'rsp', 'r8',
+    'r9', 'r10', 'r11', 'r12', 'r13', 'r14', 'r15', 'rip', 'efl']
+here = os.path.dirname(os.path.abspath(__file__))
+windbg_path = os.path.join(here, 'windbg.py')
+pipe_prefix = '\\\\.\\pipe\\'
+sim_timeout = 30
+drain_rounds = 200
+sim_steps = 500
+bp_probes = 100     # breakpoints set and looked up one at a time
+vtable_visits = 5000
+vtable_loop = 32    # functions the replayed loop runs through
+startup_runs = 5
+launch_runs = 20
+# imported on first use since loading the plugin shouldn't pay for them
+lazy_modules = ['win32com', 'win32com.client', 'win32gui', 'win32process',
+    'win32con', 'subprocess']
+drain_batches = [1, 16, 256]
+pipe_count = [0]
+
+
+def debugger(conn):
+    """Answers like windbg.py: a register delta per step and a bps_result per
+    batch of breakpoints"""
+    ip = 0x140001000
+    regs = dict((name, 0) for name in x64_regs)
+    while True:
+        try:
+            cmd, params = protocol.recv(conn)
+        except (IOError, EOFError):
+            return
+        if cmd == 'step_over':
+            ip += 5
+            regs['rip'] = ip
+            regs['rax'] += 1
+            protocol.send(conn, 'set_ip', {'ip': ip,
+                'regs': {'rip': ip, 'rax': regs['rax']}})
+        elif cmd == 'set_bps':
+            protocol.send(conn, 'bps_result', {'cmd': cmd,
+                'addrs': params['addrs'], 'ok': True})
+        elif cmd == 'sync':
+            # stands in for a burst of stops, e.g. while tracing
+            full = dict((name, 0x7ff000000000 + i) for i, name in enumerate(x64_regs))
+            for i in range(params['count']):
+                protocol.send(conn, 'set_ip', {'ip': ip + i, 'regs': full,
+                    'full': True})
+
+
+class Kernel32(object):
+    """The kernel32 calls signal_ready makes, on the named events of the
+    win32event stand-in"""
+
+    def OpenEventW(self, access, inherit, name):
+        import win32event
+        return name.value if name.value in win32event.events else 0
+
+    def SetEvent(self, event):
+        import win32event
+        win32event.events[event].set()
+
+    def CloseHandle(self, event):
+        pass
+
+
+class WinDLL(object):
+    def __init__(self):
+        self.kernel32 = Kernel32()
+
+
+def pipe_address(address):
+    """Maps a named pipe to a Unix socket, which is what multiprocessing
+    listens on outside Windows"""
+    if sys.platform != 'win32' and address and address.startswith(pipe_prefix):
+        return os.path.join(tempfile.gettempdir(),
+            'bindbg-' + address[len(pipe_prefix):])
+    return address
+
+
+def simulate(events=None):
+    """Makes the stand-ins and the Windows-only parts both ends use available
+    to this process"""
+    import builtins
+    for path in (os.path.join(here, 'sim'), os.path.join(here, 'binja_toolbar')):
+        if path not in sys.path:
+            sys.path.insert(0, path)
+    builtins.long = int     # windbg.py runs on WinDbg's Python 2
+    import win32event
+    win32event.events.update(events or { })
+    # the plugin waits on the stand-in's events, so windbg.py has to set
+    # those instead of kernel32's, even on Windows
+    ctypes.windll = WinDLL()
+    if sys.platform == 'win32':
+        return
+    builtins.WindowsError = OSError
+    connection = multiprocessing.connection
+    connection.Listener = lambda address=None, *args, **kwargs: \
+        Listener(pipe_address(address), *args, **kwargs)
+    connection.Client = lambda address, *args, **kwargs: \
+        Client(pipe_address(address), *args, **kwargs)
+
+
+def new_pipe():
+    pipe_count[0] += 1
+    return 'bench-{}-{}'.format(os.getpid(), pipe_count[0])
+
+
+def load_debugger(pipe):
+    """Loads windbg.py the way !py --global does, listening on pipe"""
+    import importlib.util
+    argv = sys.argv
+    sys.argv = [windbg_path, pipe]
+    try:
+        spec = importlib.util.spec_from_file_location('windbg', windbg_path)
+        windbg = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(windbg)
+    finally:
+        sys.argv = argv
+    return windbg
+
+
+def run_debugger(pipe, ready=None):
+    """windbg.py in a child process, signalling ready once it listens, or
+    the event a launching plugin created if ready isn't given"""
+    simulate({protocol.ready_event_name(pipe): ready} if ready else None)
+    import pykd
+    # a forked child inherits the parent's handlers
+    del pykd.handlers[:]
+    pykd.reset()
+    sys.stdout = open(os.devnull, 'w')
+    load_debugger(pipe)
+    threading.Event().wait()    # WinDbg keeps the interpreter alive
+
+
+def load_plugin():
+    import importlib.util
+    spec = importlib.util.spec_from_file_location('bindbg',
+        os.path.join(here, '__init__.py'), submodule_search_locations=[here])
+    plugin = importlib.util.module_from_spec(spec)
+    sys.modules['bindbg'] = plugin
+    spec.loader.exec_module(plugin)
+    return plugin
+
+
+def wait_for(condition):
+    deadline = clock() + sim_timeout
+    while not condition():
+        if clock() > deadline:
+            raise RuntimeError("Timed out waiting for the simulated session")
+        threading.Event().wait(.0005)
+
+
+def sink():
+    """A connection for windbg.py to send to, with everything sent discarded"""
+    conn, other = Pipe()
+
+    def discard():
+        try:
+            while True:
+                other.recv_bytes()
+        except (IOError, EOFError):
+            pass
+    t = threading.Thread(target=discard)
+    t.daemon = True
+    t.start()
+    return conn
+
+
+def code_addrs(count):
+    """The first count instruction addresses of the simulated target"""
+    import target
+    return [target.code + i // target.instrs * target.function_size
+        + i % target.instrs * target.instr_length for i in range(count)]
+
+
+class Simulation(object):
+    """windbg.py in a child process, and a session for bv once connected.
+    With launch set the child is only started by launch(), which stands in
+    for the session starting WinDbg."""
+
+    def __init__(self, plugin, bv=None, launch=False):
+        import binaryninja
+        self.plugin = plugin
+        self.bv = bv or binaryninja.BinaryView()
+        self.pipe = new_pipe()
+        self.bv.session_data['pipe'] = self.pipe
+        self.session = None
+        self.child = None
+        if launch:
+            return
+        ready = Event()
+        self.child = Process(target=run_debugger, args=[self.pipe, ready])
+        self.child.daemon = True
+        self.child.start()
+        if not ready.wait(sim_timeout):
+            raise RuntimeError("windbg.py didn't start listening")
+
+    def launch(self):
+        # windbg.py signals the event the session created before launching
+        self.child = Process(target=run_debugger, args=[self.pipe])
+        self.child.daemon = True
+        self.child.start()
+
+    def connect(self):
+        """Starts the session and returns once the sync has been shown"""
+        self.plugin.start(self.bv)
+        self.session = self.bv.session_data['bindbg']
+        wait_for(lambda: self.bv.navigated is not None)
+
+    def close(self):
+        if self.session:
+            # from the UI thread like Binja's stop command, so it can't race
+            # a drain that's applying highlights
+            import binaryninja
+            binaryninja.execute_on_main_thread_and_wait(
+                lambda: self.session.stop("Benchmark finished"))
+        if self.child:
+            self.child.terminate()
+            self.child.join()
+        # a killed listener leaves its socket behind
+        path = pipe_address(pipe_prefix + self.pipe)
+        if path != pipe_prefix + self.pipe and os.path.exists(path):
+            os.remove(path)
+
+
+def percentiles(samples, unit='us'):
+    scale = {'us': 1e6, 'ms': 1e3}[unit]
+    samples = sorted(samples)
+    return {
+        'mean_' + unit: sum(samples) / len(samples) * scale,
+        'p50_' + unit: samples[len(samples) // 2] * scale,
+        'p99_' + unit: samples[int(len(samples) * .99)] * scale,
+    }
+
+
+def bench_step_latency(conn):
+    samples = []
+    for i in range(steps):
+        start = clock()
+        protocol.send(conn, 'step_over', { })
+        protocol.recv(conn)
+        samples.append(clock() - start)
+    return percentiles(samples)
+
+
+def bench_throughput(conn):
+    start = clock()
+    protocol.send(conn, 'sync', {'count': messages})
+    for i in range(messages):
+        protocol.recv(conn)
+    elapsed = clock() - start
+    return {'messages_per_second': messages / elapsed}
+
+
+def bench_sync(conn):
+    results = { }
+    for count in bp_counts:
+        addrs = [0x140001000 + i * 0x10 for i in range(count)]
+        start = clock()
+        protocol.send(conn, 'set_bps', {'addrs': addrs})
+        protocol.recv(conn)
+        results[str(count)] = {
+            'round_trip_ms': (clock() - start) * 1e3,
+            'frame_bytes': len(protocol.encode('set_bps', {'addrs': addrs})),
+        }
+    return results
+
+
+def bench_modules():
+    table = ModuleTable()
+    for i in range(500):
+        table.add(0x7ff800000000 + i * 0x100000, 0x7ff800000000 + i * 0x100000
+            + 0x80000, 'module{}.dll'.format(i))
+    addrs = [random.randrange(0x7ff800000000, 0x7ff800000000 + 500 * 0x100000)
+        for i in range(100000)]
+    start = clock()
+    for addr in addrs:
+        table.lookup(addr)
+    return {'lookups_per_second': len(addrs) / (clock() - start)}
+
+
+def bench_memory():
+    cache = PageCache(1024)
+    data = b'\xcc' * page_size
+    pages = [(0x10000000 + i * page_size, data) for i in range(1024)]
+    fetch = lambda pages: None
+
+    peak = None
+    if tracemalloc:
+        tracemalloc.start()
+    cache.fill(cache.generation, pages)
+    if tracemalloc:
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+    start = clock()
+    for i in range(100000):
+        cache.read(0x10000000 + (i * 0x38) % (1024 * page_size - 8), 8, fetch)
+    reads = 100000 / (clock() - start)
+    return {'cached_reads_per_second': reads, 'page_cache_peak_bytes': peak}
+
+
+def bench_trace():
+    fd, path = tempfile.mkstemp()
+    os.close(fd)
+    count = 100000
+    try:
+        writer = tracefile.TraceWriter(path, count, 0x140000000, x64_regs)
+        regs = list(range(len(x64_regs)))
+        start = clock()
+        for i in range(count):
+            writer.append(0x140001000 + i, i & 1, regs)
+        written = count / (clock() - start)
+        writer.close()
+
+        reader = tracefile.TraceReader(path)
+        start = clock()
+        for record in reader:
+            pass
+        read = count / (clock() - start)
+        reader.close()
+    finally:
+        os.remove(path)
+    return {'records_written_per_second': written,
+        'records_read_per_second': read}
+
+
+def bench_sim_process(windbg):
+    """Time windbg.py's process() takes per command, against the simulated
+    target"""
+    addrs = code_addrs(1000)
+    pages = [0x140000000 + i * page_size for i in range(4)]
+    commands = [
+        ('step_over', [('step_over', { })] * steps),
+        ('set_bp', [('set_bp', {'addr': addr}) for addr in addrs]),
+        ('delete_bp', [('delete_bp', {'addr': addr}) for addr in addrs]),
+        ('read_pages', [('read_pages', {'id': i, 'pages': pages})
+            for i in range(1000)]),
+        ('sync', [('sync', {'version': protocol.VERSION})] * 100),
+    ]
+    results = { }
+    for name, messages in commands:
+        samples = []
+        for data in messages:
+            with windbg.lock:
+                start = clock()
+                windbg.process(data)
+                samples.append(clock() - start)
+        results[name] = percentiles(samples)
+    return results
+
+
+def bench_sim_step_bytes(windbg):
+    """Bytes windbg.py sends per step with every register in each stop, as
+    it used to, against only the registers that changed"""
+    get_regs = windbg.get_regs
+    modes = [('full_regs', lambda full=False: get_regs(full=True)),
+        ('changed_regs', get_regs)]
+    results = { }
+    try:
+        for name, regs in modes:
+            windbg.get_regs = regs
+            windbg.stats.reset()
+            windbg.stats.enabled = True
+            for i in range(steps):
+                with windbg.lock:
+                    windbg.process(('step_over', { }))
+                    windbg.update_state()
+            windbg.stats.enabled = False
+            sent = windbg.stats.bytes
+            results[name] = {
+                'bytes_per_step': sum(sent.values()) / float(steps),
+                'set_ip_bytes_per_step': sent.get('set_ip', 0) / float(steps),
+            }
+    finally:
+        windbg.get_regs = get_regs
+        windbg.stats.enabled = False
+    return results
+
+
+class Uncached(dict):
+    """A vtable_sites that forgets every site, so each visit parses the
+    instruction again"""
+
+    def __setitem__(self, key, value):
+        pass
+
+
+def bench_sim_vtable(windbg):
+    """update_vtable over a loop of the simulated target's functions, with
+    windbg.py's cache of parsed call sites and without it"""
+    import pykd
+    import target
+    loop_end = target.code + vtable_loop * target.function_size
+    ip, regs = pykd.getIP(), dict(pykd.state['regs'])
+    sites = windbg.vtable_sites
+    parse_vtable_site = windbg.parse_vtable_site
+    parses = [0]
+
+    # each parse disassembles through pykd, which is far slower in WinDbg
+    # than in the stand-in, so the count matters more than the time here
+    def counted(current_ip):
+        parses[0] += 1
+        return parse_vtable_site(current_ip)
+    windbg.parse_vtable_site = counted
+    results = { }
+    try:
+        for name, cache in [('uncached', Uncached()), ('cached', sites)]:
+            windbg.vtable_sites = cache
+            cache.clear()
+            windbg.vtable_results.clear()
+            pykd.setIP(target.code)
+            pykd.state['regs'] = dict(regs)
+            samples = []
+            parses[0] = 0
+            with windbg.lock:
+                for i in range(vtable_visits):
+                    pykd.execute()
+                    # a hot loop, so the same call sites are visited again
+                    if pykd.getIP() >= loop_end:
+                        pykd.setIP(target.code)
+                    start = clock()
+                    windbg.update_vtable(pykd.getIP())
+                    samples.append(clock() - start)
+                windbg.vtable_visits.flush()
+            results[name] = percentiles(samples)
+            results[name]['parses'] = parses[0]
+    finally:
+        windbg.vtable_sites = sites
+        windbg.parse_vtable_site = parse_vtable_site
+        pykd.setIP(ip)
+        pykd.state['regs'] = regs
+    return results
+
+
+def bench_sim_registry(windbg):
+    """Setting, reconciling and clearing N breakpoints in windbg.py's
+    BreakpointRegistry, with the simulated debugger's breakpoint table"""
+    results = { }
+    for count in bp_counts:
+        addrs = code_addrs(count)
+        with windbg.lock:
+            start = clock()
+            windbg.bps.set_many(addrs)
+            set_many = clock() - start
+            start = clock()
+            windbg.bps.reconcile()
+            reconcile = clock() - start
+            start = clock()
+            windbg.bps.remove_many(addrs)
+            remove_many = clock() - start
+        results[str(count)] = {
+            'set_many_ms': set_many * 1e3,
+            'reconcile_ms': reconcile * 1e3,
+            'remove_many_ms': remove_many * 1e3,
+        }
+    return results
+
+
+def linear_get_bp(windbg, addr):
+    """How windbg.py found a breakpoint before BreakpointRegistry: a scan of
+    the debugger's whole breakpoint table"""
+    for index in range(0, windbg.getNumberBreakpoints()):
+        bp = windbg.getBp(index)
+        if windbg.breakpoint.getOffset(bp) == addr:
+            return bp
+
+
+def linear_reconcile(windbg, known):
+    """update_bps before BreakpointRegistry, minus the messages"""
+    current = []
+    for index in range(0, windbg.getNumberBreakpoints()):
+        bp = windbg.getBp(index)
+        addr = windbg.breakpoint.getOffset(bp)
+        current.append(addr)
+        if addr not in known:
+            known[addr] = bp
+    for addr in list(known):
+        if addr not in current:
+            del known[addr]
+
+
+def bench_sim_bp_scaling(windbg):
+    """Cost of single breakpoint operations with N breakpoints already set,
+    through BreakpointRegistry and through the linear scans it replaced"""
+    results = { }
+    for count in bp_counts:
+        addrs = code_addrs(count + bp_probes)
+        table, probes = addrs[:count], addrs[count:]
+        with windbg.lock:
+            windbg.bps.set_many(table)
+            timings = { }
+
+            start = clock()
+            for addr in probes:
+                windbg.bps.set(addr)
+            timings['registry_set_ms'] = (clock() - start) / bp_probes
+            start = clock()
+            for addr in probes:
+                windbg.bps.by_addr[addr]
+            timings['registry_lookup_ms'] = (clock() - start) / bp_probes
+            start = clock()
+            windbg.bps.reconcile()
+            timings['registry_reconcile_ms'] = clock() - start
+            windbg.bps.remove_many(probes)
+
+            start = clock()
+            for addr in probes:
+                windbg.dbgCommand('bu ' + windbg.findSymbol(addr, True))
+                linear_get_bp(windbg, addr)
+            timings['linear_set_ms'] = (clock() - start) / bp_probes
+            start = clock()
+            for addr in probes:
+                linear_get_bp(windbg, addr)
+            timings['linear_lookup_ms'] = (clock() - start) / bp_probes
+            start = clock()
+            linear_reconcile(windbg, { })
+            timings['linear_reconcile_ms'] = clock() - start
+
+            windbg.bps.reconcile()
+            windbg.bps.remove_many(addrs)
+        results[str(count)] = dict((name, seconds * 1e3)
+            for name, seconds in timings.items())
+    return results
+
+
+def measure_startup(conn):
+    """Loads the plugin in this fresh interpreter, then initializes the
+    toolbar the way its command does, and sends back what each cost"""
+    simulate()
+    before = set(sys.modules)
+    start = clock()
+    load_plugin()
+    loaded = clock() - start
+    import binaryninja
+    import binja_toolbar
+    result = {
+        'load_ms': loaded * 1e3,
+        'toolbar_built_on_load': binja_toolbar.toolbar is not None,
+        'heavy_modules_on_load': sorted(set(lazy_modules) & (set(sys.modules)
+            - before)),
+    }
+    for name, action in binaryninja.PluginCommand.commands:
+        if name == "Initialize Toolbar for this view":
+            start = clock()
+            action(binaryninja.BinaryView())
+            result['toolbar_ms'] = (clock() - start) * 1e3
+    result['toolbar_built'] = binja_toolbar.toolbar is not None
+    conn.send(result)
+
+
+def bench_sim_startup():
+    """Time for Binja to load the plugin, each time in a new interpreter
+    so no module is imported already"""
+    context = multiprocessing.get_context('spawn')
+    runs = []
+    for i in range(startup_runs):
+        conn, child_conn = context.Pipe()
+        child = context.Process(target=measure_startup, args=[child_conn])
+        child.start()
+        if not conn.poll(sim_timeout):
+            child.terminate()
+            raise RuntimeError("The plugin never finished loading")
+        runs.append(conn.recv())
+        child.join()
+    result = percentiles([run['load_ms'] / 1e3 for run in runs], 'ms')
+    result['toolbar_ms'] = sum(run['toolbar_ms'] for run in runs) / len(runs)
+    for key in ('toolbar_built_on_load', 'heavy_modules_on_load',
+            'toolbar_built'):
+        result[key] = runs[-1][key]
+    return result
+
+
+def bench_sim_launch(plugin):
+    """Time from starting a session with no debugger listening until its
+    sync is shown, through the plugin's own launch handshake: the ready
+    event windbg.py sets once it listens, then connect and sync"""
+    start_windbg = plugin.BinDbgSession.start_windbg
+    current = [None]
+    plugin.BinDbgSession.start_windbg = lambda session: current[0].launch()
+    samples = []
+    try:
+        for i in range(launch_runs):
+            sim = current[0] = Simulation(plugin, launch=True)
+            try:
+                start = clock()
+                sim.connect()
+                samples.append(clock() - start)
+            finally:
+                sim.close()
+    finally:
+        plugin.BinDbgSession.start_windbg = start_windbg
+    return percentiles(samples, 'ms')
+
+
+def bench_sim_sync(plugin):
+    """Time from starting a session on a view with N saved breakpoints until
+    windbg.py has confirmed all of them"""
+    import binaryninja
+    confirmed = Event()
+    bps_result = plugin.BinDbgSession.bps_result
+
+    def confirm(self, *args):
+        bps_result(self, *args)
+        confirmed.set()
+    plugin.BinDbgSession.bps_result = confirm
+
+    results = { }
+    sim = None
+    try:
+        for count in bp_counts:
+            if sim:
+                sim.close()
+            bv = binaryninja.BinaryView()
+            bv.store_metadata('bindbg.bps', dict(('{:#x}'.format(addr - bv.start),
+                { }) for addr in code_addrs(count)))
+            sim = Simulation(plugin, bv)
+            highlights = [0]
+            bv.on_highlight = lambda addr, color: \
+                highlights.__setitem__(0, highlights[0] + 1)
+            confirmed.clear()
+            start = clock()
+            sim.connect()
+            if not confirmed.wait(sim_timeout):
+                raise RuntimeError("Breakpoints were never confirmed")
+            results[str(count)] = {
+                'round_trip_ms': (clock() - start) * 1e3,
+                'highlight_calls': highlights[0],
+            }
+    except Exception:
+        if sim:
+            sim.close()
+        raise
+    finally:
+        plugin.BinDbgSession.bps_result = bps_result
+    return results, sim
+
+
+def bench_sim_step(plugin):
+    """Time from the session sending step_over until the new IP is
+    highlighted in the view, through both real ends"""
+    sim = Simulation(plugin)
+    try:
+        sim.connect()
+        shown = threading.Event()
+        previous = [None]
+
+        def highlighted(addr, color):
+            if color is plugin.ip_color and addr != previous[0]:
+                shown.set()
+        sim.bv.on_highlight = highlighted
+        samples = []
+        for i in range(sim_steps):
+            previous[0] = sim.session.ip
+            shown.clear()
+            start = clock()
+            sim.session.send('step_over')
+            if not shown.wait(sim_timeout):
+                raise RuntimeError("The step was never highlighted")
+            samples.append(clock() - start)
+            # the highlight is applied before the rest of the stop
+            wait_for(lambda: sim.session.ip != previous[0])
+        return percentiles(samples, 'ms')
+    finally:
+        sim.close()
+
+
+def bench_sim_drain(sim):
+    """BinDbgSession.drain over batches of stops, on a view with many
+    breakpoints highlighted: Highlights should only repaint what moved"""
+    session = sim.session
+    highlights = [0]
+    sim.bv.on_highlight = lambda addr, color: \
+        highlights.__setitem__(0, highlights[0] + 1)
+    import target
+    addrs = code_addrs(target.functions * target.instrs)
+    results = { }
+    for batch in drain_batches:
+        samples = []
+        highlights[0] = 0
+        for i in range(drain_rounds):
+            for j in range(i * batch, (i + 1) * batch):
+                ip = addrs[j % len(addrs)]
+                session.pending.put(('set_ip', {'ip': ip,
+                    'regs': {'rip': ip, 'rdx': j}}))
+            start = clock()
+            session.drain()
+            samples.append(clock() - start)
+        results[str(batch)] = percentiles(samples)
+        results[str(batch)]['highlight_calls_per_drain'] = \
+            highlights[0] / float(drain_rounds)
+    return results
+
+
+def bench_simulated():
+    simulate()
+    plugin = load_plugin()
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        startup = bench_sim_startup()
+        launch = bench_sim_launch(plugin)
+        step = bench_sim_step(plugin)
+        sync, sim = bench_sim_sync(plugin)
+        try:
+            drain = bench_sim_drain(sim)
+        finally:
+            sim.close()
+        # only now, so forked debuggers don't inherit its threads
+        windbg = load_debugger(new_pipe())
+        windbg.conn = sink()
+        results = {
+            'startup': startup,
+            'first_sync': launch,
+            'step_to_highlight': step,
+            'sync': sync,
+            'drain': drain,
+            'process': bench_sim_process(windbg),
+            'step_bytes': bench_sim_step_bytes(windbg),
+            'vtable': bench_sim_vtable(windbg),
+            'registry': bench_sim_registry(windbg),
+            'bp_scaling': bench_sim_bp_scaling(windbg),
+        }
+    return results
+
+
+def main():
+    conn, child_conn = Pipe()
+    child = Process(target=debugger, args=[child_conn])
+    child.daemon = True
+    child.start()
+
+    results = {
+        'protocol_version': protocol.VERSION,
+        'python': sys.version.split()[0],
+        'step_latency': bench_step_latency(conn),
+        'throughput': bench_throughput(conn),
+        'sync': bench_sync(conn),
+        'modules': bench_modules(),
+        'memory': bench_memory(),
+        'trace': bench_trace(),
+    }
+    if sys.version_info[0] >= 3:
+        results['simulated'] = bench_simulated()
+    conn.close()
+    child.terminate()
+
+    output = json.dumps(results, indent=2, sort_keys=True)
+    if len(sys.argv) > 1:
+        with open(sys.argv[1], 'w') as f:
+            f.write(output)
+    print(output)
+
+
+if __name__ == '__main__':
+    main()
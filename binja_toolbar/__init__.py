@@ -28,9 +28,29 @@ from binaryninja import PluginCommand
 from widgets import BinjaButtonHolderWidget
 from functools import partial
 
-toolbar = BinjaButtonHolderWidget()
+toolbar = None
+pending_widgets = []
 global_binary_view = None
 
+def get_toolbar():
+    """ Builds the toolbar on first use, since finding the main window walks every widget """
+    global toolbar
+    if toolbar is None:
+        toolbar = BinjaButtonHolderWidget()
+        for add in pending_widgets:
+            add()
+        del pending_widgets[:]
+    return toolbar
+
+def deferred(fun):
+    """ Queues widgets added before the toolbar is built """
+    def wrapper(*args, **kwargs):
+        if toolbar is None:
+            pending_widgets.append(partial(fun, *args, **kwargs))
+        else:
+            fun(*args, **kwargs)
+    return wrapper
+
 def get_binary_view():
     """ Internal function that gets the best guess at the current binary view """
     global global_binary_view
@@ -38,6 +58,7 @@ def get_binary_view():
         return global_binary_view
     print("Binary View has not been initialized")
 
+@deferred
 def add_text_button(name, fun=None, tooltip=None):
     """ Adds a pushbutton with a text label to the toolbar """
     button = QtWidgets.QPushButton(name, toolbar)
@@ -47,6 +68,7 @@ def add_text_button(name, fun=None, tooltip=None):
         button.setToolTip(tooltip)
     toolbar.add_widget(button)
 
+@deferred
 def add_image_button(filename, size, fun=None, tooltip=None):
     """ Adds a pushbutton with an icon to the toolbar  """
     button = QtWidgets.QPushButton('', toolbar)
@@ -58,6 +80,7 @@ def add_image_button(filename, size, fun=None, tooltip=None):
     button.setIconSize(QtCore.QSize(size[0], size[1]))
     toolbar.add_widget(button)
 
+@deferred
 def add_picker(pickeritems, callback):
     """ Adds a combobox widget to the toolbar """
     picker = QtWidgets.QComboBox()
@@ -70,7 +93,7 @@ def set_bv(binary_view):
     """ Caches the binary view so that button callbacks can have access to it """
     global global_binary_view
     global_binary_view = binary_view
-    if not toolbar.isVisible():
+    if not get_toolbar().isVisible():
         toolbar.toggle()
 
 PluginCommand.register("Initialize Toolbar for this view", "", set_bv)
@@ -0,0 +1,85 @@
+"""
+Conditional branch prediction from a register snapshot.
+
+Branches are decoded once per address into a Branch and then evaluated with
+a single table lookup on every stop.
+"""
+
+from collections import namedtuple
+
+Branch = namedtuple('Branch', ['mnemonic', 'taken', 'fallthrough'])
+
+
+def counter(regs):
+    # loop* and jrcxz use rcx on x64 and ecx on x86
+    if 'rcx' in regs:
+        return regs['rcx'], 0xffffffffffffffff
+    return regs['ecx'], 0xffffffff
+
+
+def loop_continues(regs):
+    # loop decrements the counter before testing it
+    value, mask = counter(regs)
+    return (value - 1) & mask != 0
+
+
+predicates = {
+    'jo': lambda r: r['of'] == 1,
+    'jno': lambda r: r['of'] == 0,
+    'js': lambda r: r['sf'] == 1,
+    'jns': lambda r: r['sf'] == 0,
+    'je': lambda r: r['zf'] == 1,
+    'jz': lambda r: r['zf'] == 1,
+    'jne': lambda r: r['zf'] == 0,
+    'jnz': lambda r: r['zf'] == 0,
+    'jb': lambda r: r['cf'] == 1,
+    'jnae': lambda r: r['cf'] == 1,
+    'jc': lambda r: r['cf'] == 1,
+    'jnb': lambda r: r['cf'] == 0,
+    'jae': lambda r: r['cf'] == 0,
+    'jnc': lambda r: r['cf'] == 0,
+    'jbe': lambda r: r['cf'] == 1 or r['zf'] == 1,
+    'jna': lambda r: r['cf'] == 1 or r['zf'] == 1,
+    'ja': lambda r: r['cf'] == 0 and r['zf'] == 0,
+    'jnbe': lambda r: r['cf'] == 0 and r['zf'] == 0,
+    'jl': lambda r: r['sf'] != r['of'],
+    'jnge': lambda r: r['sf'] != r['of'],
+    'jge': lambda r: r['sf'] == r['of'],
+    'jnl': lambda r: r['sf'] == r['of'],
+    'jle': lambda r: r['zf'] == 1 or r['sf'] != r['of'],
+    'jng': lambda r: r['zf'] == 1 or r['sf'] != r['of'],
+    'jg': lambda r: r['zf'] == 0 and r['sf'] == r['of'],
+    'jnle': lambda r: r['zf'] == 0 and r['sf'] == r['of'],
+    'jp': lambda r: r['pf'] == 1,
+    'jpe': lambda r: r['pf'] == 1,
+    'jnp': lambda r: r['pf'] == 0,
+    'jpo': lambda r: r['pf'] == 0,
+    'jcxz': lambda r: counter(r)[0] & 0xffff == 0,
+    'jecxz': lambda r: counter(r)[0] & 0xffffffff == 0,
+    'jrcxz': lambda r: counter(r)[0] == 0,
+    'loop': loop_continues,
+    'loope': lambda r: loop_continues(r) and r['zf'] == 1,
+    'loopz': lambda r: loop_continues(r) and r['zf'] == 1,
+    'loopne': lambda r: loop_continues(r) and r['zf'] == 0,
+    'loopnz': lambda r: loop_continues(r) and r['zf'] == 0,
+}
+
+
+def decode(text, addr, length):
+    """Decodes disassembly text such as 'jne 0x401020' into a Branch, or
+    returns None if it isn't a conditional branch with a known target"""
+    parts = text.split()
+    if len(parts) != 2 or parts[0] not in predicates:
+        return None
+    try:
+        taken = int(parts[1], 16)
+    except ValueError:
+        return None
+    return Branch(parts[0], taken, addr + length)
+
+
+def next_ip(branch, regs):
+    """Returns the address execution will continue at after branch"""
+    if predicates[branch.mnemonic](regs):
+        return branch.taken
+    return branch.fallthrough
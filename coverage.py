@@ -0,0 +1,56 @@
+from binaryninja import HighlightStandardColor
+import struct
+
+coverage_color = HighlightStandardColor.CyanHighlightColor
+
+# drcov BB table entry: start offset from module base, size, module ID
+drcov_entry = struct.Struct('<IHH')
+
+
+class Coverage:
+    """Basic block hit counts collected by the debugger's coverage mode
+
+    Block IDs are indexes into self.blocks, which is what the debugger
+    reports back instead of addresses.
+    """
+
+    def __init__(self, bv, highlights):
+        self.bv = bv
+        self.highlights = highlights
+        self.blocks = [block for func in bv.functions
+            for block in func.basic_blocks]
+        self.hits = [0] * len(self.blocks)
+
+    def addrs(self):
+        return [block.start for block in self.blocks]
+
+    def add_hits(self, block_ids):
+        for id in block_ids:
+            if self.hits[id] == 0:
+                self.highlights.set_block(self.blocks[id], coverage_color)
+            self.hits[id] += 1
+        self.highlights.flush()
+
+    def clear(self):
+        self.hits = [0] * len(self.blocks)
+        self.highlights.clear_blocks()
+        self.highlights.flush()
+
+    def summary(self):
+        covered = sum(1 for hits in self.hits if hits)
+        return "{} of {} blocks covered".format(covered, len(self.blocks))
+
+    def export_drcov(self, path, module_path):
+        """Writes covered blocks in drcov format for lighthouse & co."""
+        covered = [block for block, hits in zip(self.blocks, self.hits) if hits]
+        with open(path, 'wb') as f:
+            f.write(b'DRCOV VERSION: 2\n')
+            f.write(b'DRCOV FLAVOR: bindbg\n')
+            f.write(b'Module Table: version 2, count 1\n')
+            f.write(b'Columns: id, base, end, entry, checksum, timestamp, path\n')
+            f.write('0, {:#x}, {:#x}, 0x0, 0x0, 0x0, {}\n'.format(
+                self.bv.start, self.bv.end, module_path).encode('utf-8'))
+            f.write('BB Table: {} bbs\n'.format(len(covered)).encode('utf-8'))
+            for block in covered:
+                f.write(drcov_entry.pack(block.start - self.bv.start,
+                    min(block.end - block.start, 0xffff), 0))
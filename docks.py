@@ -0,0 +1,76 @@
+from PyQt5 import QtWidgets
+from PyQt5.QtCore import Qt
+
+
+class StackDockWidget(QtWidgets.QDockWidget):
+    """Stack Dock Widget:
+        A dockable list of the target's call stack, innermost frame first,
+        docked next to the toolbar
+    """
+    def __init__(self, toolbar, on_activate, *__args):
+        super(StackDockWidget, self).__init__("Call stack", *__args)
+        self._list = QtWidgets.QListWidget()
+        self._list.itemDoubleClicked.connect(
+            lambda item: on_activate(self.count() - 1 - self._list.row(item)))
+        self.setWidget(self._list)
+        main_window = toolbar.main_window
+        main_window.addDockWidget(Qt.TopDockWidgetArea, self)
+        main_window.splitDockWidget(toolbar, self, Qt.Horizontal)
+
+    def count(self):
+        return self._list.count()
+
+    def update_frames(self, keep, labels):
+        """Keeps the keep outermost frames and pushes labels (outermost
+        first) on top of them"""
+        while self._list.count() > keep:
+            self._list.takeItem(0)
+        for label in labels:
+            self._list.insertItem(0, label)
+
+
+class RegistersDockWidget(QtWidgets.QDockWidget):
+    """Registers Dock Widget:
+        The registers at a stop, with the ones that changed since the previous
+        stop in bold, and a slider to scrub back through earlier stops
+    """
+    def __init__(self, toolbar, on_select, *__args):
+        super(RegistersDockWidget, self).__init__("Registers", *__args)
+        self._slider = QtWidgets.QSlider(Qt.Horizontal)
+        self._slider.valueChanged.connect(on_select)
+        self._label = QtWidgets.QLabel()
+        self._table = QtWidgets.QTableWidget(0, 2)
+        self._table.setHorizontalHeaderLabels(["Register", "Value"])
+        self._table.verticalHeader().hide()
+        self._table.setEditTriggers(QtWidgets.QAbstractItemView.NoEditTriggers)
+
+        layout = QtWidgets.QVBoxLayout()
+        layout.addWidget(self._slider)
+        layout.addWidget(self._label)
+        layout.addWidget(self._table)
+        widget = QtWidgets.QWidget()
+        widget.setLayout(layout)
+        self.setWidget(widget)
+
+        main_window = toolbar.main_window
+        main_window.addDockWidget(Qt.TopDockWidgetArea, self)
+        main_window.splitDockWidget(toolbar, self, Qt.Horizontal)
+
+    def show_stop(self, stop, first, last, label, regs, changed):
+        # moving the slider here mustn't be reported as the user scrubbing
+        self._slider.blockSignals(True)
+        self._slider.setRange(first, last)
+        self._slider.setValue(stop)
+        self._slider.blockSignals(False)
+        self._label.setText("Stop {} of {}: {}".format(stop + 1, last + 1, label))
+
+        names = sorted(regs)
+        self._table.setRowCount(len(names))
+        for row, name in enumerate(names):
+            value = QtWidgets.QTableWidgetItem('{:#x}'.format(regs[name]))
+            if name in changed:
+                font = value.font()
+                font.setBold(True)
+                value.setFont(font)
+            self._table.setItem(row, 0, QtWidgets.QTableWidgetItem(name))
+            self._table.setItem(row, 1, value)
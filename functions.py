@@ -0,0 +1,93 @@
+from binaryninja import BinaryDataNotification
+import bisect
+
+
+class FunctionIndex(BinaryDataNotification):
+    """Maps addresses to the function containing them
+
+    The index is built from the basic block ranges of every function the
+    first time it's queried, and dropped whenever analysis adds, removes or
+    updates a function so the next query rebuilds it. Blocks may overlap,
+    e.g. when functions share code, so it also keeps the furthest end of any
+    block up to each position.
+    """
+
+    def __init__(self, bv):
+        super(FunctionIndex, self).__init__()
+        self.bv = bv
+        self.index = None
+        bv.register_notification(self)
+
+    def close(self):
+        self.bv.unregister_notification(self)
+
+    def function_added(self, view, func):
+        self.index = None
+
+    def function_removed(self, view, func):
+        self.index = None
+
+    def function_updated(self, view, func):
+        self.index = None
+
+    def build(self):
+        ranges = []
+        for func in self.bv.functions:
+            for block in func.basic_blocks:
+                ranges.append((block.start, block.end, func))
+        ranges.sort(key=lambda r: r[0])
+        reach = []
+        end = 0
+        for r in ranges:
+            end = max(end, r[1])
+            reach.append(end)
+        self.index = ([r[0] for r in ranges], reach, ranges)
+        return self.index
+
+    def lookup(self, addr):
+        """Returns the function containing addr, or None if there isn't one"""
+        index = self.index
+        if index is None:
+            index = self.build()
+        starts, reach, ranges = index
+        i = bisect.bisect_right(starts, addr) - 1
+        # an earlier, longer block can contain addr, but none can once the
+        # blocks up to here all end before it
+        while i >= 0 and addr < reach[i]:
+            start, end, func = ranges[i]
+            if addr < end:
+                return func
+            i -= 1
+        return None
+
+
+class SymbolCache(BinaryDataNotification):
+    """Memoises symbol lookups by address until a symbol changes"""
+
+    def __init__(self, bv):
+        super(SymbolCache, self).__init__()
+        self.bv = bv
+        self.names = { }
+        bv.register_notification(self)
+
+    def close(self):
+        self.bv.unregister_notification(self)
+
+    def symbol_added(self, view, sym):
+        self.names = { }
+
+    def symbol_updated(self, view, sym):
+        self.names = { }
+
+    def symbol_removed(self, view, sym):
+        self.names = { }
+
+    def lookup(self, addr):
+        """Returns the full name of the symbol at addr, or None"""
+        try:
+            return self.names[addr]
+        except KeyError:
+            sym = self.bv.get_symbol_at(addr)
+            name = sym.full_name if sym else None
+            self.names[addr] = name
+            return name
@@ -0,0 +1,83 @@
+"""
+Layered highlights for one BinaryView.
+
+Every layer maps instruction addresses to a color, and an instruction shows
+the color of its highest layer that has one. Changes are staged and applied
+by flush(), which only calls into Binja for instructions whose visible color
+actually changed, so a step costs a handful of calls however many
+breakpoints or trace highlights the view has.
+
+Coverage is kept at basic block level, under every instruction layer.
+"""
+
+from binaryninja import HighlightStandardColor
+
+no_color = HighlightStandardColor.NoHighlightColor
+
+# lowest priority first
+layers = ['trace', 'breakpoint', 'branch', 'ip', 'hit']
+
+
+class Highlights:
+    def __init__(self, functions):
+        self.functions = functions
+        self.layers = dict((layer, { }) for layer in layers)
+        self.shown = { }            # address -> color applied in Binja
+        self.dirty = set()
+        self.blocks = { }           # block start -> (block, color)
+        self.dirty_blocks = { }     # block start -> (block, color or None)
+
+    def set(self, layer, addr, color):
+        if self.layers[layer].get(addr) is not color:
+            self.layers[layer][addr] = color
+            self.dirty.add(addr)
+
+    def discard(self, layer, addr):
+        if self.layers[layer].pop(addr, None) is not None:
+            self.dirty.add(addr)
+
+    def clear(self, layer=None):
+        for name in [layer] if layer else layers:
+            self.dirty.update(self.layers[name])
+            self.layers[name].clear()
+        if not layer:
+            self.clear_blocks()
+
+    def set_block(self, block, color):
+        self.dirty_blocks[block.start] = (block, color)
+
+    def clear_blocks(self):
+        for start, (block, color) in self.blocks.items():
+            self.dirty_blocks[start] = (block, None)
+
+    def color(self, addr):
+        for layer in reversed(layers):
+            color = self.layers[layer].get(addr)
+            if color is not None:
+                return color
+        return None
+
+    def flush(self):
+        for addr in self.dirty:
+            color = self.color(addr)
+            if color is self.shown.get(addr):
+                continue
+            func = self.functions.lookup(addr)
+            if func:
+                func.set_auto_instr_highlight(addr,
+                    no_color if color is None else color)
+            if color is None:
+                self.shown.pop(addr, None)
+            else:
+                self.shown[addr] = color
+        self.dirty.clear()
+
+        for start, (block, color) in self.dirty_blocks.items():
+            if color is self.blocks.get(start, (None, None))[1]:
+                continue
+            block.set_auto_highlight(no_color if color is None else color)
+            if color is None:
+                self.blocks.pop(start, None)
+            else:
+                self.blocks[start] = (block, color)
+        self.dirty_blocks.clear()
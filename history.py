@@ -0,0 +1,82 @@
+"""
+Register values at every stop, kept as fixed-width rows in a preallocated
+ring buffer, so a long session never grows past its memory budget.
+
+Columns follow a register schema that's fixed by the first snapshot. Each
+row also stores a bitmask of the registers that changed since the previous
+stop, so diffs between consecutive stops cost a single read.
+
+    row     <Q          IP
+            <Q * words  changed mask, one bit per schema column
+            <Q * regs   register values
+"""
+
+import struct
+
+
+class RegisterHistory:
+    def __init__(self, max_bytes=16 << 20):
+        self.max_bytes = max_bytes
+        self.reset([])
+
+    def reset(self, schema):
+        self.schema = list(schema)
+        self.columns = dict((name, i) for i, name in enumerate(self.schema))
+        self.mask_words = (len(self.schema) + 63) // 64
+        self.row = struct.Struct('<Q' + 'Q' * (self.mask_words + len(self.schema)))
+        self.capacity = max(1, self.max_bytes // self.row.size)
+        self.data = bytearray(self.capacity * self.row.size)
+        self.last = None    # values of the newest row
+        self.end = 0        # number of stops ever recorded
+
+    def __len__(self):
+        return min(self.end, self.capacity)
+
+    def first(self):
+        """Number of the oldest stop still stored"""
+        return self.end - len(self)
+
+    def last_stop(self):
+        return self.end - 1
+
+    def record(self, ip, regs):
+        """Stores the full register state at a stop and returns its number"""
+        if self.last is None or any(name not in self.columns for name in regs):
+            # a new schema, e.g. the first sync or a different target
+            self.reset(sorted(regs))
+        values = [regs.get(name, 0) & 0xffffffffffffffff for name in self.schema]
+
+        mask = 0
+        if self.last is not None:
+            for i, (old, new) in enumerate(zip(self.last, values)):
+                if old != new:
+                    mask |= 1 << i
+        words = [(mask >> (64 * i)) & 0xffffffffffffffff
+            for i in range(self.mask_words)]
+
+        offset = (self.end % self.capacity) * self.row.size
+        self.row.pack_into(self.data, offset, ip, *(words + values))
+        self.last = values
+        self.end += 1
+        return self.end - 1
+
+    def _unpack(self, stop):
+        if not self.first() <= stop < self.end:
+            raise IndexError("Stop {} is no longer stored".format(stop))
+        return self.row.unpack_from(self.data,
+            (stop % self.capacity) * self.row.size)
+
+    def get(self, stop):
+        """Returns (ip, regs) at a stop"""
+        fields = self._unpack(stop)
+        values = fields[1 + self.mask_words:]
+        return fields[0], dict(zip(self.schema, values))
+
+    def changed(self, stop):
+        """Returns the registers that changed from the previous stop"""
+        fields = self._unpack(stop)
+        mask = 0
+        for i, word in enumerate(fields[1:1 + self.mask_words]):
+            mask |= word << (64 * i)
+        return set(name for i, name in enumerate(self.schema)
+            if mask >> i & 1)
@@ -0,0 +1,71 @@
+from collections import OrderedDict
+import threading
+
+page_size = 0x1000
+
+
+class PageCache:
+    """LRU cache of aligned target memory pages
+
+    Pages are fetched in bulk through fetch(pages), which must block until
+    fill() has been called with the debugger's reply. Unreadable pages are
+    cached as None so they aren't requested again at the same stop. The whole
+    cache is dropped by invalidate() whenever the target resumes.
+    """
+
+    def __init__(self, max_pages=1024):
+        self.max_pages = max_pages
+        self.pages = OrderedDict()
+        self.lock = threading.Lock()
+        self.generation = 0
+
+    def invalidate(self):
+        with self.lock:
+            self.generation += 1
+            self.pages.clear()
+
+    def fill(self, generation, pages):
+        with self.lock:
+            # the target has run since these were requested
+            if generation != self.generation:
+                return
+            for addr, data in pages:
+                self.pages.pop(addr, None)
+                self.pages[addr] = data
+            while len(self.pages) > self.max_pages:
+                self.pages.popitem(last=False)
+
+    def prefetch(self, ranges, fetch):
+        """Fetches every missing page covering the (addr, size) ranges with a
+        single request"""
+        missing = set()
+        with self.lock:
+            for addr, size in ranges:
+                for page in page_range(addr, size):
+                    if page not in self.pages:
+                        missing.add(page)
+        if missing:
+            fetch(sorted(missing))
+
+    def read(self, addr, size, fetch):
+        """Returns size bytes of target memory at addr, or None if any of it
+        is unreadable"""
+        self.prefetch([(addr, size)], fetch)
+        chunks = []
+        with self.lock:
+            for page in page_range(addr, size):
+                if page not in self.pages:
+                    return None     # evicted or the request timed out
+                data = self.pages.pop(page)
+                self.pages[page] = data     # most recently used
+                if data is None:
+                    return None
+                chunks.append(data)
+        data = b''.join(chunks)
+        start = addr - (addr & ~(page_size - 1))
+        return data[start:start+size]
+
+
+def page_range(addr, size):
+    first = addr & ~(page_size - 1)
+    return range(first, addr + size, page_size)
@@ -0,0 +1,65 @@
+"""
+Sorted table of the modules loaded in the target, shared by both ends.
+
+Addresses on the wire are absolute debugger addresses; the table is what maps
+them back to a module (and from there to a BinaryView) with a bisect.
+"""
+
+from collections import namedtuple
+import bisect
+
+Module = namedtuple('Module', ['base', 'end', 'name'])
+
+
+class ModuleTable(object):
+    def __init__(self):
+        self.bases = []
+        self.modules = []
+        self.by_name = { }
+
+    def __iter__(self):
+        return iter(list(self.modules))
+
+    def __len__(self):
+        return len(self.modules)
+
+    def add(self, base, end, name):
+        self.remove(base)
+        module = Module(base, end, name.lower())
+        i = bisect.bisect_left(self.bases, base)
+        self.bases.insert(i, base)
+        self.modules.insert(i, module)
+        self.by_name[module.name] = module
+        return module
+
+    def remove(self, base):
+        i = bisect.bisect_left(self.bases, base)
+        if i == len(self.bases) or self.bases[i] != base:
+            return None
+        del self.bases[i]
+        module = self.modules.pop(i)
+        if self.by_name.get(module.name) == module:
+            del self.by_name[module.name]
+        return module
+
+    def clear(self):
+        self.bases = []
+        self.modules = []
+        self.by_name = { }
+
+    def lookup(self, addr):
+        """Returns the module containing addr, or None"""
+        i = bisect.bisect_right(self.bases, addr) - 1
+        if i >= 0 and addr < self.modules[i].end:
+            return self.modules[i]
+        return None
+
+    def find(self, name):
+        return self.by_name.get(name.lower())
+
+    def describe(self, addr):
+        """Formats addr as module+offset, which survives ASLR"""
+        module = self.lookup(addr)
+        if module:
+            return '{}+{:#x}'.format(module.name, addr - module.base)
+        return '{:#x}'.format(addr)
@@ -0,0 +1,250 @@
+"""
+Binary wire protocol shared by the Binja plugin and the WinDbg extension.
+
+Messages are framed by multiprocessing.connection's send_bytes/recv_bytes, so
+any Connection (named pipe, Unix socket, socketpair) can carry them. A frame
+is a one byte message type ID followed by the message params as a dict of
+tagged values:
+
+    N           None
+    T / F       True / False
+    u <Q        non-negative int (addresses, registers)
+    i <q        negative int
+    f <d        float
+    s <I ...    text, utf-8
+    b <I ...    raw bytes
+    l <I ...    list, followed by that many values
+    d <I ...    dict, followed by that many (<B key, value) pairs
+
+Lists and dicts nest at most max_depth deep, counting the params dict.
+Nothing but these types can be decoded, so unlike pickle a malformed or
+malicious frame can't do more than raise ProtocolError.
+"""
+
+import struct
+import sys
+import time
+
+# bump whenever the message set or encoding changes incompatibly
+VERSION = 2
+max_depth = 32
+
+# IDs are part of the protocol, so only ever append to this table
+MESSAGE_TYPES = {
+    'print': 1,
+    'sync': 2,
+    'set_ip': 3,
+    'set_bp': 4,
+    'delete_bp': 5,
+    'bp_hit': 6,
+    'vtable': 7,
+    'go': 8,
+    'break': 9,
+    'step_out': 10,
+    'step_in': 11,
+    'step_over': 12,
+    'run_to': 13,
+    'set_bps': 14,
+    'delete_bps': 15,
+    'bps_result': 16,
+    'start_coverage': 17,
+    'stop_coverage': 18,
+    'coverage_hits': 19,
+    'record_trace': 20,
+    'trace_done': 21,
+    'modules': 22,
+    'module_load': 23,
+    'module_unload': 24,
+    'read_pages': 25,
+    'pages': 26,
+    'resumed': 27,
+    'stack': 28,
+    'stats': 29,
+    'session_log': 30,
+    'step': 31,
+    'step_done': 32,
+    'log_samples': 33,
+    'vtable_visits': 34,
+}
+MESSAGE_NAMES = dict((id, name) for name, id in MESSAGE_TYPES.items())
+
+if sys.version_info[0] < 3:
+    text_type = unicode
+    native_str = str
+    integer_types = (int, long)
+    bytes_types = (bytearray,)
+else:
+    text_type = str
+    native_str = None
+    integer_types = (int,)
+    bytes_types = (bytes, bytearray)
+
+header = struct.Struct('<B')
+length = struct.Struct('<I')
+key_length = struct.Struct('<B')
+unsigned = struct.Struct('<Q')
+signed = struct.Struct('<q')
+double = struct.Struct('<d')
+
+
+class ProtocolError(Exception):
+    pass
+
+
+def ready_event_name(pipe):
+    """Named event the WinDbg extension sets once its listener is up"""
+    return 'Local\\bindbg-ready-' + pipe
+
+
+def encode(command, params):
+    try:
+        chunks = [header.pack(MESSAGE_TYPES[command])]
+    except KeyError:
+        raise ProtocolError("Unknown message type {}".format(command))
+    try:
+        encode_value(params, chunks, 1)
+    except (struct.error, OverflowError) as e:
+        # e.g. an int past 64 bits, or a key longer than 255 bytes
+        raise ProtocolError("Can't encode {}: {}".format(command, e))
+    return b''.join(chunks)
+
+
+def encode_value(value, chunks, depth):
+    if value is None:
+        chunks.append(b'N')
+    elif value is True:
+        chunks.append(b'T')
+    elif value is False:
+        chunks.append(b'F')
+    elif isinstance(value, integer_types):
+        if value >= 0:
+            chunks.append(b'u' + unsigned.pack(value))
+        else:
+            chunks.append(b'i' + signed.pack(value))
+    elif isinstance(value, float):
+        chunks.append(b'f' + double.pack(value))
+    elif isinstance(value, bytes_types):
+        chunks.append(b'b' + length.pack(len(value)))
+        chunks.append(bytes(value))
+    elif isinstance(value, (text_type, str)):
+        # in py2 a plain str is already utf-8 (or ascii) bytes
+        if isinstance(value, text_type):
+            value = value.encode('utf-8')
+        chunks.append(b's' + length.pack(len(value)))
+        chunks.append(value)
+    elif isinstance(value, (list, tuple, dict)) and depth > max_depth:
+        raise ProtocolError("Can't encode values nested over {} deep".format(
+            max_depth))
+    elif isinstance(value, (list, tuple)):
+        chunks.append(b'l' + length.pack(len(value)))
+        for item in value:
+            encode_value(item, chunks, depth + 1)
+    elif isinstance(value, dict):
+        chunks.append(b'd' + length.pack(len(value)))
+        for key, item in value.items():
+            if isinstance(key, text_type):
+                key = key.encode('utf-8')
+            chunks.append(key_length.pack(len(key)))
+            chunks.append(key)
+            encode_value(item, chunks, depth + 1)
+    else:
+        raise ProtocolError("Can't encode {!r}".format(value))
+
+
+def decode(data):
+    try:
+        id, = header.unpack_from(data, 0)
+        command = MESSAGE_NAMES[id]
+        params, offset = decode_value(data, header.size, 1)
+    except KeyError:
+        raise ProtocolError("Unknown message type {}".format(id))
+    except (struct.error, IndexError, UnicodeDecodeError) as e:
+        raise ProtocolError("Malformed message: {}".format(e))
+    if offset != len(data) or not isinstance(params, dict):
+        raise ProtocolError("Malformed message")
+    return command, params
+
+
+def decode_text(data):
+    data = bytes(data)
+    return data if native_str else data.decode('utf-8')
+
+
+def decode_value(data, offset, depth):
+    tag = data[offset:offset+1]
+    offset += 1
+    if tag in (b'l', b'd') and depth > max_depth:
+        raise ProtocolError("Message nested over {} deep".format(max_depth))
+    if tag == b'u':
+        return unsigned.unpack_from(data, offset)[0], offset + unsigned.size
+    elif tag == b'N':
+        return None, offset
+    elif tag == b'T':
+        return True, offset
+    elif tag == b'F':
+        return False, offset
+    elif tag == b'i':
+        return signed.unpack_from(data, offset)[0], offset + signed.size
+    elif tag == b'f':
+        return double.unpack_from(data, offset)[0], offset + double.size
+    elif tag in (b's', b'b'):
+        size, = length.unpack_from(data, offset)
+        offset += length.size
+        value = data[offset:offset+size]
+        if len(value) != size:
+            raise ProtocolError("Truncated message")
+        if tag == b's':
+            return decode_text(value), offset + size
+        return bytes(value), offset + size
+    elif tag == b'l':
+        count, = length.unpack_from(data, offset)
+        offset += length.size
+        items = []
+        for _ in range(count):
+            item, offset = decode_value(data, offset, depth + 1)
+            items.append(item)
+        return items, offset
+    elif tag == b'd':
+        count, = length.unpack_from(data, offset)
+        offset += length.size
+        items = { }
+        for _ in range(count):
+            size, = key_length.unpack_from(data, offset)
+            offset += key_length.size
+            key = decode_text(data[offset:offset+size])
+            offset += size
+            items[key], offset = decode_value(data, offset, depth + 1)
+        return items, offset
+    raise ProtocolError("Unknown value tag {!r}".format(tag))
+
+
+def send(conn, command, params, stats=None, log=None):
+    if stats and stats.enabled:
+        # lets the other end measure how long the frame spent in transit
+        params = dict(params, _sent=time.time())
+        start = stats.clock()
+        data = encode(command, params)
+        stats.record(command, 'encode', stats.clock() - start, len(data))
+    else:
+        data = encode(command, params)
+    if log:
+        log.sent(data)
+    conn.send_bytes(data)
+
+
+def recv(conn, stats=None, log=None):
+    data = conn.recv_bytes()
+    if log:
+        log.received(data)
+    if not (stats and stats.enabled):
+        command, params = decode(data)
+        params.pop('_sent', None)
+        return command, params
+
+    start = stats.clock()
+    command, params = decode(data)
+    stats.record(command, 'decode', stats.clock() - start, len(data))
+    sent = params.pop('_sent', None)
+    if sent is not None:
+        stats.record(command, 'transfer', time.time() - sent)
+    return command, params
@@ -0,0 +1,81 @@
+"""
+Append-only log of the protocol frames crossing the pipe, kept so a session
+can be replayed into Binja without a debugger attached.
+
+Frames are logged exactly as they were sent or received, so the log is as
+compact as the protocol itself and is decoded with protocol.decode.
+
+    header  <8sII       magic, version, end that wrote the log
+    record  <dBI        time sent or received, direction, frame length
+            frame       protocol frame
+"""
+
+import struct
+import threading
+import time
+
+magic = b'BDSLOG\0\0'
+version = 1
+header = struct.Struct('<8sII')
+record = struct.Struct('<dBI')
+
+# which end wrote the log
+binja = 0
+windbg = 1
+
+# record directions, relative to the end that wrote the log
+outgoing = 0
+incoming = 1
+
+
+class SessionLog:
+    def __init__(self, path, end):
+        self.file = open(path, 'wb')
+        self.file.write(header.pack(magic, version, end))
+        self.lock = threading.Lock()
+
+    def sent(self, data):
+        self.write(outgoing, data)
+
+    def received(self, data):
+        self.write(incoming, data)
+
+    def write(self, direction, data):
+        with self.lock:
+            self.file.write(record.pack(time.time(), direction, len(data)))
+            self.file.write(data)
+
+    def close(self):
+        with self.lock:
+            self.file.close()
+
+
+class SessionLogReader:
+    def __init__(self, path):
+        self.file = open(path, 'rb')
+        data = self.file.read(header.size)
+        if len(data) < header.size:
+            raise ValueError("{} is not a session log".format(path))
+        file_magic, file_version, self.end = header.unpack(data)
+        if file_magic != magic or file_version != version:
+            raise ValueError("{} is not a version {} session log".format(
+                path, version))
+
+    def __iter__(self):
+        """Yields (time, direction, frame) for every complete record"""
+        while True:
+            data = self.file.read(record.size)
+            if len(data) < record.size:
+                return
+            when, direction, size = record.unpack(data)
+            frame = self.file.read(size)
+            if len(frame) < size:
+                return      # cut short, e.g. the debugger was killed
+            yield when, direction, frame
+
+    def to_binja(self):
+        """The direction of the frames that were sent to Binja"""
+        return incoming if self.end == binja else outgoing
+
+    def close(self):
+        self.file.close()
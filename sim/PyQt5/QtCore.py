@@ -0,0 +1,10 @@
+class Qt(object):
+    TopDockWidgetArea = 4
+    Horizontal = 1
+    Vertical = 2
+
+
+class QSize(object):
+    def __init__(self, width, height):
+        self.width = width
+        self.height = height
@@ -0,0 +1,11 @@
+class QIcon(object):
+    def __init__(self, filename=None):
+        self.filename = filename
+
+
+class QFont(object):
+    def __init__(self):
+        self.bold = False
+
+    def setBold(self, bold):
+        self.bold = bold
@@ -0,0 +1,158 @@
+from .QtGui import QFont
+
+
+class Signal(object):
+    def __init__(self):
+        self.slots = []
+
+    def connect(self, slot):
+        self.slots.append(slot)
+
+    def emit(self, *args):
+        for slot in self.slots:
+            slot(*args)
+
+
+class QWidget(object):
+    """Accepts any Qt call; the ones the plugin reads back are overridden"""
+
+    def __init__(self, *args):
+        self.visible = False
+        self.children_ = []
+
+    def __getattr__(self, name):
+        if name.startswith('__'):
+            raise AttributeError(name)
+        return lambda *args, **kwargs: None
+
+    def show(self):
+        self.visible = True
+
+    def hide(self):
+        self.visible = False
+
+    def isVisible(self):
+        return self.visible
+
+    def children(self):
+        return self.children_
+
+
+class QDockWidget(QWidget):
+    pass
+
+
+class QToolBar(QWidget):
+    pass
+
+
+class QPushButton(QWidget):
+    def __init__(self, *args):
+        super(QPushButton, self).__init__(*args)
+        self.clicked = Signal()
+
+
+class QComboBox(QWidget):
+    def __init__(self, *args):
+        super(QComboBox, self).__init__(*args)
+        self.currentIndexChanged = Signal()
+
+
+class QMenu(QWidget):
+    def __init__(self, title='', *args):
+        super(QMenu, self).__init__(*args)
+        self.title_ = title
+
+    def title(self):
+        return self.title_
+
+
+class QMainWindow(QWidget):
+    def __init__(self, *args):
+        super(QMainWindow, self).__init__(*args)
+        self.menu = QWidget()
+        self.menu.children_.append(QMenu(u'&Tools'))
+
+    def menuWidget(self):
+        return self.menu
+
+
+class QApplication(object):
+    app = None
+
+    def __init__(self, *args):
+        self.widgets = [QMainWindow()]
+
+    @classmethod
+    def instance(cls):
+        if cls.app is None:
+            cls.app = cls()
+        return cls.app
+
+    def allWidgets(self):
+        return self.widgets
+
+
+class QAbstractItemView(object):
+    NoEditTriggers = 0
+
+
+class QListWidget(QWidget):
+    def __init__(self, *args):
+        super(QListWidget, self).__init__(*args)
+        self.items = []
+        self.itemDoubleClicked = Signal()
+
+    def count(self):
+        return len(self.items)
+
+    def takeItem(self, row):
+        return self.items.pop(row)
+
+    def insertItem(self, row, item):
+        self.items.insert(row, item)
+
+    def row(self, item):
+        return self.items.index(item)
+
+
+class QSlider(QWidget):
+    def __init__(self, *args):
+        super(QSlider, self).__init__(*args)
+        self.valueChanged = Signal()
+        self.value = 0
+
+    def setValue(self, value):
+        self.value = value
+
+
+class QLabel(QWidget):
+    pass
+
+
+class QTableWidget(QWidget):
+    def __init__(self, rows=0, columns=0, *args):
+        super(QTableWidget, self).__init__(*args)
+        self.cells = { }
+
+    def verticalHeader(self):
+        return QWidget()
+
+    def setItem(self, row, column, item):
+        self.cells[row, column] = item
+
+
+class QTableWidgetItem(object):
+    def __init__(self, text=''):
+        self.text = text
+        self.font_ = QFont()
+
+    def font(self):
+        return self.font_
+
+    def setFont(self, font):
+        self.font_ = font
+
+
+class QVBoxLayout(QWidget):
+    pass
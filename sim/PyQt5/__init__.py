@@ -0,0 +1,5 @@
+"""
+Stand-in for the parts of PyQt5 the plugin's docks and toolbar use, so they
+can be built outside Binja for benchmarks. Widgets accept any call and keep
+only the state the plugin reads back.
+"""
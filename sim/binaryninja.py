@@ -0,0 +1,273 @@
+"""
+Stand-in for the Binary Ninja API, so the plugin can run outside Binja for
+benchmarks.
+
+BinaryView covers the program described in target.py with one function per
+function in the target. Callbacks passed to execute_on_main_thread run on a
+thread of their own, like Binja's UI thread, and every instruction highlight
+is recorded on the view so benchmarks can time when a change became visible.
+"""
+
+from enum import Enum
+import copy
+import threading
+import traceback
+try:
+    import Queue as queue
+except ImportError:
+    import queue
+
+import target
+
+__all__ = ['BinaryDataNotification', 'BinaryView', 'HighlightColor',
+    'HighlightStandardColor', 'PluginCommand', 'execute_on_main_thread',
+    'execute_on_main_thread_and_wait', 'get_int_input', 'get_open_filename_input',
+    'get_save_filename_input', 'get_text_line_input']
+
+
+class HighlightStandardColor(Enum):
+    NoHighlightColor = 0
+    BlueHighlightColor = 1
+    GreenHighlightColor = 2
+    CyanHighlightColor = 3
+    RedHighlightColor = 4
+    MagentaHighlightColor = 5
+    YellowHighlightColor = 6
+    OrangeHighlightColor = 7
+    WhiteHighlightColor = 8
+    BlackHighlightColor = 9
+
+
+class HighlightColor(object):
+    def __init__(self, color=None, mix_color=None, mix=None):
+        self.color = color
+        self.mix_color = mix_color
+        self.mix = mix
+
+
+class BinaryDataNotification(object):
+    def __init__(self):
+        pass
+
+
+class PluginCommand(object):
+    commands = []
+
+    @classmethod
+    def register(cls, name, description, action):
+        cls.commands.append((name, action))
+
+    register_for_address = register
+    register_for_function = register
+
+
+# answers to the get_*_input prompts, by title; None is a cancelled prompt
+responses = { }
+
+
+def get_text_line_input(prompt, title):
+    return responses.get(title)
+
+
+def get_int_input(prompt, title):
+    return responses.get(title)
+
+
+def get_save_filename_input(prompt, ext=''):
+    return responses.get(prompt)
+
+
+def get_open_filename_input(prompt, ext=''):
+    return responses.get(prompt)
+
+
+main_queue = queue.Queue()
+
+
+def main_loop():
+    while True:
+        func = main_queue.get()
+        try:
+            func()
+        except Exception:
+            traceback.print_exc()
+
+
+def execute_on_main_thread(func):
+    main_queue.put(func)
+
+
+def execute_on_main_thread_and_wait(func):
+    done = threading.Event()
+
+    def run():
+        try:
+            func()
+        finally:
+            done.set()
+    main_queue.put(run)
+    done.wait()
+
+
+main_thread = threading.Thread(target=main_loop)
+main_thread.daemon = True
+main_thread.start()
+
+
+class FileMetadata(object):
+    def __init__(self, filename):
+        self.filename = filename
+
+
+class Architecture(object):
+    def __init__(self, name, address_size):
+        self.name = name
+        self.address_size = address_size
+
+
+class Symbol(object):
+    def __init__(self, name, address):
+        self.name = self.full_name = self.raw_name = name
+        self.address = address
+
+
+class BasicBlock(object):
+    def __init__(self, function, start, end):
+        self.function = function
+        self.start = start
+        self.end = end
+        self.length = end - start
+        self.highlight = None
+
+    def set_auto_highlight(self, color):
+        self.highlight = color
+
+
+class Function(object):
+    def __init__(self, view, start):
+        self.view = view
+        self.start = start
+        self.name = target.symbol(start)
+        self.symbol = Symbol(self.name, start)
+        self.basic_blocks = [BasicBlock(self, block_start, block_end)
+            for block_start, block_end in target.blocks(start)]
+        self.comments = { }
+        self.code_refs = set()
+
+    @property
+    def instructions(self):
+        for block in self.basic_blocks:
+            for addr in range(block.start, block.end, target.instr_length):
+                yield [self.view.get_disassembly(addr)], addr
+
+    def set_auto_instr_highlight(self, addr, color):
+        self.view.highlighted(addr, color)
+
+    def get_comment_at(self, addr):
+        return self.comments.get(addr, '')
+
+    def set_comment_at(self, addr, comment):
+        if comment:
+            self.comments[addr] = comment
+        else:
+            self.comments.pop(addr, None)
+
+    def get_constants_referenced_by(self, addr):
+        return []
+
+    def add_user_code_ref(self, from_addr, to_addr):
+        self.code_refs.add((from_addr, to_addr))
+
+
+class BinaryView(object):
+    def __init__(self, filename='target.bndb'):
+        self.file = FileMetadata(filename)
+        self.arch = Architecture('x86_64', 8)
+        self.start = target.base
+        self.end = target.end
+        self.view = 'Linear:PE'
+        self.session_data = { }
+        self.metadata = { }
+        self.comments = { }
+        self.data_vars = { }
+        self.notifications = []
+        self.functions = [Function(self, target.code + i * target.function_size)
+            for i in range(target.functions)]
+        self.highlights = { }
+        self.on_highlight = None    # called with (addr, color) on every change
+        self.navigated = None
+
+    def highlighted(self, addr, color):
+        self.highlights[addr] = color
+        if self.on_highlight:
+            self.on_highlight(addr, color)
+
+    def register_notification(self, notify):
+        self.notifications.append(notify)
+
+    def unregister_notification(self, notify):
+        if notify in self.notifications:
+            self.notifications.remove(notify)
+
+    def is_valid_offset(self, addr):
+        return self.start <= addr < self.end
+
+    def navigate(self, view, addr):
+        self.navigated = addr
+        return True
+
+    def store_metadata(self, key, value):
+        self.metadata[key] = copy.deepcopy(value)
+
+    def query_metadata(self, key):
+        return copy.deepcopy(self.metadata[key])
+
+    def get_comment_at(self, addr):
+        return self.comments.get(addr, '')
+
+    def set_comment_at(self, addr, comment):
+        if comment:
+            self.comments[addr] = comment
+        else:
+            self.comments.pop(addr, None)
+
+    def get_functions_containing(self, addr):
+        if not target.is_code(addr):
+            return []
+        start = target.function_start(addr)
+        return [self.functions[(start - target.code) // target.function_size]]
+
+    def get_function_at(self, addr):
+        funcs = self.get_functions_containing(addr)
+        return funcs[0] if funcs and funcs[0].start == addr else None
+
+    def get_symbol_at(self, addr):
+        func = self.get_function_at(addr)
+        return func.symbol if func else None
+
+    def get_symbol_by_raw_name(self, name):
+        for func in self.functions:
+            if func.name == name:
+                return func.symbol
+        return None
+
+    def get_code_refs(self, addr):
+        return []
+
+    def get_disassembly(self, addr):
+        mnemonic, operand = target.decode(addr)
+        if mnemonic == 'mov':
+            dest, src, disp = operand
+            return 'mov {}, qword [{}]'.format(dest,
+                src + '+{:#x}'.format(disp) if disp else src)
+        if mnemonic == 'call':
+            src, disp = operand
+            if disp is None:
+                return 'call {}'.format(src)
+            return 'call qword [{}+{:#x}]'.format(src, disp)
+        if mnemonic in ('jne', 'jmp'):
+            return '{} {:#x}'.format(mnemonic, operand)
+        return '{} {}'.format(mnemonic, operand)
+
+    def get_instruction_length(self, addr):
+        return target.instr_length
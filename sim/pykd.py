@@ -0,0 +1,452 @@
+"""
+Stand-in for pykd, so windbg.py can run outside WinDbg for benchmarks.
+
+Simulates one thread executing the program described in target.py, with the
+pykd calls windbg.py makes: registers, memory, disassembly in WinDbg's format,
+breakpoints through dbgCommand and the event callbacks. Execution is
+synchronous like it is from a pykd script, so go() returns once the target
+breaks again, after go_limit instructions at most.
+"""
+
+import heapq
+import re
+import struct
+
+import target
+
+__all__ = ['DbgException', 'MemoryException', 'eventResult', 'executionStatus',
+    'eventHandler', 'breakpoint', 'module', 'disasm', 'stackFrame', 'loadBytes',
+    'ptrPtr', 'isValid', 'findSymbol', 'expr', 'getNumberRegisters',
+    'getRegisterName', 'reg', 'getIP', 'setIP', 'getStack', 'getModulesList',
+    'getExecutionStatus', 'trace', 'step', 'go', 'breakin',
+    'getNumberBreakpoints', 'getBp', 'dbgCommand']
+
+go_limit = 100000
+stack_depth = 8     # frames outside the current function
+mask = 0xffffffffffffffff
+
+
+class DbgException(Exception):
+    pass
+
+
+class MemoryException(DbgException):
+    pass
+
+
+class eventResult(object):
+    Proceed = 0
+    NoChange = 1
+    Break = 2
+
+
+class executionStatus(object):
+    NoChange = 0
+    Go = 1
+    Break = 6
+    NoDebuggee = 7
+
+
+handlers = []
+
+
+class eventHandler(object):
+    def __init__(self):
+        handlers.append(self)
+
+    def onBreakpoint(self, bpid):
+        return eventResult.NoChange
+
+    def onException(self, exceptInfo):
+        return eventResult.NoChange
+
+    def onExecutionStatusChange(self, status):
+        pass
+
+    def onLoadModule(self, base, name):
+        return eventResult.NoChange
+
+    def onUnloadModule(self, base, name):
+        return eventResult.NoChange
+
+    def onChangeBreakpoints(self):
+        pass
+
+
+def notify(event, *args):
+    """Calls event on every handler and returns whether any wants to stop"""
+    stop = False
+    for handler in list(handlers):
+        if getattr(handler, event)(*args) != eventResult.Proceed:
+            stop = True
+    return stop
+
+
+class breakpoint(object):
+    def __init__(self, id, offset, one_shot):
+        self.id = id
+        self.offset = offset
+        self.one_shot = one_shot
+
+    def getId(self):
+        return self.id
+
+    def getOffset(self):
+        return self.offset
+
+    def remove(self):
+        if by_offset.get(self.offset) is self:
+            delete_bps([self])
+
+
+class module(object):
+    def __init__(self, addr):
+        for mod in loaded:
+            if mod.base <= addr < mod.end_addr:
+                self.base, self.end_addr, self.mod_name = \
+                    mod.base, mod.end_addr, mod.mod_name
+                return
+        raise DbgException("module not found at {:#x}".format(addr))
+
+    def begin(self):
+        return self.base
+
+    def end(self):
+        return self.end_addr
+
+    def name(self):
+        return self.mod_name
+
+
+class disasm(object):
+    def __init__(self, offset=None):
+        self.offset = state['ip'] if offset is None else offset
+
+    def length(self):
+        return target.instr_length
+
+    def instruction(self):
+        mnemonic, operand = target.decode(self.offset)
+        if mnemonic == 'mov':
+            dest, src, disp = operand
+            operand = '{},qword ptr [{}]'.format(dest,
+                src + '+{:x}h'.format(disp) if disp else src)
+        elif mnemonic == 'call':
+            src, disp = operand
+            if disp is not None:
+                operand = 'qword ptr [{}+{:x}h]'.format(src, disp)
+            elif '!' in findSymbol(reg(src)):
+                # WinDbg annotates registers that point at a symbol
+                operand = '{} {{{} ({})}}'.format(src, findSymbol(reg(src)),
+                    address(reg(src)))
+            else:
+                operand = src
+        elif mnemonic in ('jne', 'jmp'):
+            operand = '{} ({})'.format(findSymbol(operand), address(operand))
+        return '{} 90909090        {:<7} {}'.format(address(self.offset),
+            mnemonic, operand)
+
+
+class stackFrame(object):
+    def __init__(self, instructionOffset, frameOffset):
+        self.instructionOffset = instructionOffset
+        self.frameOffset = frameOffset
+
+
+def address(addr):
+    """Formats an address the way WinDbg does, e.g. 00000001`40001000"""
+    return '{:08x}`{:08x}'.format(addr >> 32, addr & 0xffffffff)
+
+
+loaded = []
+breakpoints = []    # in the order WinDbg lists them
+by_offset = { }
+free_ids = []       # heap of IDs to reuse, lowest first
+state = { }
+memory = { }    # page -> bytearray, filled on first access
+
+
+def reset():
+    """Puts the target back at its entry point with no breakpoints"""
+    del loaded[:]
+    del breakpoints[:]
+    by_offset.clear()
+    del free_ids[:]
+    memory.clear()
+    mod = module.__new__(module)
+    mod.base, mod.end_addr, mod.mod_name = target.base, target.end, target.name
+    loaded.append(mod)
+    state['ip'] = target.code
+    state['status'] = executionStatus.Break
+    state['break'] = False
+    state['regs'] = dict((name, 0) for name in target.regs)
+    state['regs'].update(rcx=target.heap, rsp=0x14f000, rbp=0x14f100)
+
+
+def load_module(base, end, name):
+    mod = module.__new__(module)
+    mod.base, mod.end_addr, mod.mod_name = base, end, name
+    loaded.append(mod)
+    notify('onLoadModule', base, name)
+
+
+def unload_module(base):
+    for mod in list(loaded):
+        if mod.base == base:
+            loaded.remove(mod)
+            notify('onUnloadModule', base, mod.mod_name)
+
+
+def page(addr):
+    start = addr & ~0xfff
+    try:
+        return memory[start]
+    except KeyError:
+        pass
+    if not isValid(addr):
+        raise MemoryException("Memory exception at {:#x}".format(addr))
+    data = bytearray(b'\x90' * 0x1000) if target.is_code(addr) else \
+        bytearray(0x1000)
+    for i in range(target.functions):
+        slot = target.vtable + i * 8
+        if start <= slot < start + 0x1000:
+            struct.pack_into('<Q', data, slot - start,
+                target.code + i * target.function_size)
+    if start <= target.heap < start + 0x1000:
+        struct.pack_into('<Q', data, target.heap - start, target.vtable)
+    memory[start] = data
+    return data
+
+
+def loadBytes(offset, count):
+    data = bytearray()
+    while len(data) < count:
+        addr = offset + len(data)
+        chunk = page(addr)[addr & 0xfff:]
+        data += chunk[:count - len(data)]
+    return list(data)
+
+
+def ptrPtr(offset):
+    return struct.unpack('<Q', bytearray(loadBytes(offset, 8)))[0]
+
+
+def isValid(offset):
+    return any(mod.base <= offset < mod.end_addr for mod in loaded) or \
+        target.heap <= offset < target.heap_end
+
+
+def findSymbol(offset, showDisplacement=True):
+    for mod in loaded:
+        if not mod.base <= offset < mod.end_addr:
+            continue
+        if mod.mod_name == target.name and target.is_code(offset):
+            name = target.symbol(offset)
+            disp = offset - target.function_start(offset)
+            if disp and showDisplacement:
+                return '{}!{}+{:#x}'.format(mod.mod_name, name, disp)
+            return '{}!{}'.format(mod.mod_name, name)
+        return '{}+{:#x}'.format(mod.mod_name, offset - mod.base)
+    return '{:x}'.format(offset)
+
+
+def resolve(name):
+    """The address of a symbol as findSymbol formats it"""
+    mod_name, sep, rest = name.partition('!')
+    if sep:
+        func, _, disp = rest.partition('+')
+        return int(func[len('sub_'):], 16) + (int(disp, 16) if disp else 0)
+    mod_name, sep, disp = name.partition('+')
+    for mod in loaded:
+        if sep and mod.mod_name == mod_name:
+            return mod.base + int(disp, 16)
+    return int(name.replace('`', ''), 16)
+
+
+word_regex = re.compile(r"[\w`]+(?:![\w`]+)?")
+
+
+def expr(expression, showError=True):
+    """Evaluates a MASM expression with registers, symbols, poi() and hex
+    numbers"""
+    def value(match):
+        word = match.group(0)
+        if word == 'poi':
+            return word
+        if '!' in word:
+            return str(resolve(word))
+        if word.lower() in state['regs'] or word.lower() == 'rip':
+            return str(reg(word.lower()))
+        try:
+            return str(int(word.replace('`', '').rstrip('hH'), 16))
+        except ValueError:
+            raise DbgException("Couldn't resolve error at '{}'".format(word))
+
+    python = word_regex.sub(value, expression.replace('@', ''))
+    python = python.replace('&&', ' and ').replace('||', ' or ')
+    try:
+        return int(eval(python, {'__builtins__': { }, 'poi': ptrPtr}))
+    except DbgException:
+        raise
+    except Exception:
+        raise DbgException("Syntax error in '{}'".format(expression))
+
+
+def getNumberRegisters():
+    return len(target.regs)
+
+
+def getRegisterName(index):
+    return target.regs[index]
+
+
+def reg(name):
+    if name == 'rip':
+        return state['ip']
+    try:
+        return state['regs'][name]
+    except KeyError:
+        raise DbgException("Invalid register '{}'".format(name))
+
+
+def getIP():
+    return state['ip']
+
+
+def setIP(offset):
+    state['ip'] = offset
+
+
+def getStack():
+    frames = [stackFrame(state['ip'], state['regs']['rsp'])]
+    for depth in range(stack_depth):
+        frames.append(stackFrame(target.code + depth * target.function_size
+            + 7 * target.instr_length, 0x14f100 + depth * 0x40))
+    return frames
+
+
+def getModulesList():
+    return list(loaded)
+
+
+def getExecutionStatus():
+    return state['status']
+
+
+def set_status(status):
+    state['status'] = status
+    notify('onExecutionStatusChange', status)
+
+
+def execute():
+    """Runs the instruction at the IP"""
+    regs = state['regs']
+    ip = state['ip']
+    mnemonic, operand = target.decode(ip)
+    following = ip + target.instr_length
+    if mnemonic == 'mov':
+        dest, src, disp = operand
+        regs[dest] = ptrPtr(regs[src] + disp)
+    elif mnemonic == 'inc':
+        regs[operand] = (regs[operand] + 1) & mask
+        if operand == 'rbx':
+            regs['zf'] = int(regs['rbx'] & 3 == 0)
+            regs['efl'] = (regs['efl'] & ~0x40) | (regs['zf'] << 6)
+    elif mnemonic == 'jne':
+        if not regs['zf']:
+            following = operand
+    elif mnemonic == 'jmp':
+        following = operand
+    state['ip'] = following
+
+
+def trace():
+    set_status(executionStatus.Go)
+    execute()
+    set_status(executionStatus.Break)
+
+
+def step():
+    # calls return immediately, so stepping over is tracing
+    trace()
+
+
+def go():
+    set_status(executionStatus.Go)
+    state['break'] = False
+    for _ in range(go_limit):
+        execute()
+        stop = False
+        bp = by_offset.get(state['ip'])
+        if bp:
+            if bp.one_shot:
+                bp.remove()
+            stop = notify('onBreakpoint', bp.id)
+        if stop or state['break']:
+            break
+    set_status(executionStatus.Break)
+
+
+def breakin():
+    state['break'] = True
+
+
+def getNumberBreakpoints():
+    return len(breakpoints)
+
+
+def getBp(index):
+    return breakpoints[index]
+
+
+def set_bp(addr, one_shot):
+    bp = by_offset.get(addr)
+    if bp:
+        # WinDbg redefines the breakpoint already at an address
+        bp.one_shot = one_shot
+    else:
+        id = heapq.heappop(free_ids) if free_ids else len(breakpoints)
+        bp = by_offset[addr] = breakpoint(id, addr, one_shot)
+        breakpoints.append(bp)
+    notify('onChangeBreakpoints')
+
+
+def delete_bps(bps):
+    for bp in bps:
+        del by_offset[bp.offset]
+        heapq.heappush(free_ids, bp.id)
+    breakpoints[:] = [bp for bp in breakpoints if by_offset.get(bp.offset) is bp]
+    notify('onChangeBreakpoints')
+
+
+def dbgCommand(command):
+    for command in command.split(';'):
+        args = command.split()
+        if not args:
+            continue
+        if args[0] == 'bu':
+            one_shot = args[1] == '/1'
+            set_bp(resolve(args[-1]), one_shot)
+        elif args[0] == 'bc':
+            ids = set(args[1:])
+            delete_bps([bp for bp in breakpoints
+                if '*' in ids or str(bp.id) in ids])
+        elif args[0].startswith('$$<'):
+            with open(command.strip()[3:]) as script:
+                for line in script:
+                    dbgCommand(line)
+        elif args[0] in ('p', 't'):
+            trace()
+        elif args[0] == 'pt':
+            set_status(executionStatus.Go)
+            while target.decode(state['ip'])[0] != 'jmp':
+                execute()
+            set_status(executionStatus.Break)
+        elif args[0] == 'g':
+            go()
+        else:
+            raise DbgException("Unknown command '{}'".format(command))
+    return ''
+
+
+reset()
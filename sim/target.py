@@ -0,0 +1,82 @@
+"""
+The program both stand-ins agree on, so the addresses the simulated debugger
+reports are the ones the simulated BinaryView has functions at.
+
+One module of functions laid out back to back, each jumping to the next and
+the last back to the first, so the target never exits. Every function is
+
+    0   mov rax, qword ptr [rcx]        load the vtable of the object in rcx
+    1   inc <reg>                       one register changes per instruction
+    ...
+    6   call qword ptr [rax+10h]        virtual call, returns immediately
+    7   inc <reg>
+    8   mov rax, qword ptr [rax+18h]    load another virtual function
+    9   call rax                        and call it through the register
+    ...
+    13  jne <instruction 15>            taken unless the low bits of rbx are 0
+    14  inc <reg>
+    15  jmp <next function>
+
+Instructions are 4 bytes and functions are function_size apart, so both the
+jne and the jmp move the IP somewhere other than the next instruction.
+"""
+
+name = 'target'
+base = 0x140000000
+code = base + 0x1000
+functions = 1024
+function_size = 0x80
+instr_length = 4
+instrs = 16
+vtable = base + 0x180000    # one pointer per function
+end = base + 0x200000
+heap = 0x2000000            # the object rcx points at, then free space
+heap_end = heap + 0x10000
+
+counted = ['rdx', 'rsi', 'rdi', 'rbx']  # registers the inc instructions bump
+regs = ['rax', 'rbx', 'rcx', 'rdx', 'rsi', 'rdi', 'rbp', 'rsp', 'r8', 'r9',
+    'r10', 'r11', 'r12', 'r13', 'r14', 'r15', 'rip', 'efl', 'zf']
+
+
+def function_start(addr):
+    return code + (addr - code) // function_size * function_size
+
+
+def is_code(addr):
+    return code <= addr < code + functions * function_size and \
+        (addr - code) % function_size < instrs * instr_length
+
+
+def decode(addr):
+    """Returns (mnemonic, operand) for the instruction at addr, with the
+    operand as a register name, memory reference or branch target"""
+    start = function_start(addr)
+    index = (addr - start) // instr_length
+    if index == 0:
+        return 'mov', ('rax', 'rcx', 0)
+    if index == 6:
+        return 'call', ('rax', 0x10)
+    if index == 8:
+        return 'mov', ('rax', 'rax', 0x18)
+    if index == 9:
+        return 'call', ('rax', None)
+    if index == 13:
+        return 'jne', start + 15 * instr_length
+    if index == 15:
+        following = start + function_size
+        if following >= code + functions * function_size:
+            following = code
+        return 'jmp', following
+    return 'inc', counted[index % len(counted)]
+
+
+def blocks(start):
+    """The basic blocks of the function at start, as (start, end)"""
+    jne = start + 13 * instr_length
+    return [(start, jne + instr_length),
+        (jne + instr_length, jne + 2 * instr_length),
+        (jne + 2 * instr_length, start + instrs * instr_length)]
+
+
+def symbol(addr):
+    return 'sub_{:x}'.format(function_start(addr))
@@ -0,0 +1,10 @@
+"""
+Stand-in for the pywin32 handle call the plugin makes while it launches
+WinDbg. Events stay open by name, see win32event.py.
+"""
+
+__all__ = ['CloseHandle']
+
+
+def CloseHandle(handle):
+    pass
@@ -0,0 +1,38 @@
+"""
+Stand-in for the pywin32 event calls the plugin makes while it launches
+WinDbg, so the launch handshake can run outside Windows for benchmarks.
+
+Named events are multiprocessing Events kept by name, which a debugger
+forked after CreateEvent shares with the plugin. bench.py's kernel32
+stand-in signals them for windbg.py's OpenEventW and SetEvent.
+"""
+
+import multiprocessing
+
+__all__ = ['INFINITE', 'WAIT_OBJECT_0', 'WAIT_TIMEOUT', 'CreateEvent',
+    'SetEvent', 'WaitForSingleObject']
+
+INFINITE = 0xffffffff
+WAIT_OBJECT_0 = 0
+WAIT_TIMEOUT = 0x102
+
+events = { }    # name -> Event
+
+
+def CreateEvent(attributes, manual_reset, initial_state, name):
+    # like the real call, opens the event if one of that name exists
+    event = events.get(name)
+    if event is None:
+        event = events[name] = multiprocessing.Event()
+        if initial_state:
+            event.set()
+    return event
+
+
+def SetEvent(event):
+    event.set()
+
+
+def WaitForSingleObject(event, milliseconds):
+    timeout = None if milliseconds == INFINITE else milliseconds / 1000.0
+    return WAIT_OBJECT_0 if event.wait(timeout) else WAIT_TIMEOUT
@@ -0,0 +1,101 @@
+"""
+Optional per-message instrumentation, used by both ends.
+
+Samples are only recorded while enabled is set, and every call site checks
+it before taking a timestamp, so disabled instrumentation costs one
+attribute lookup per message.
+
+Phases:
+    encode      building a frame before it's sent
+    decode      parsing a received frame
+    transfer    wall clock time from send to receive (both ends run on the
+                same machine)
+    apply       handling a received message
+"""
+
+from collections import deque
+import time
+
+# ordered so the summary reads in the life cycle of a message
+phases = ['encode', 'transfer', 'decode', 'apply']
+
+if hasattr(time, 'perf_counter'):
+    clock = time.perf_counter
+else:
+    clock = time.clock if hasattr(time, 'clock') else time.time
+
+
+class Histogram:
+    """Latencies bucketed by powers of two microseconds"""
+
+    def __init__(self):
+        self.buckets = { }
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, seconds):
+        bucket = int(seconds * 1e6).bit_length()
+        self.buckets[bucket] = self.buckets.get(bucket, 0) + 1
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+    def percentile(self, fraction):
+        """Upper bound in seconds of the bucket holding the percentile"""
+        seen = 0
+        for bucket in sorted(self.buckets):
+            seen += self.buckets[bucket]
+            if seen >= fraction * self.count:
+                return (1 << bucket) / 1e6
+        return self.max
+
+
+class Stats:
+    clock = staticmethod(clock)
+
+    def __init__(self, max_samples=100000):
+        self.enabled = False
+        self.reset(max_samples)
+
+    def reset(self, max_samples=None):
+        self.counts = { }
+        self.bytes = { }
+        self.latencies = { }    # (command, phase) -> Histogram
+        self.samples = deque(maxlen=max_samples or self.samples.maxlen)
+
+    def record(self, command, phase, seconds, size=None):
+        key = (command, phase)
+        if key not in self.latencies:
+            self.latencies[key] = Histogram()
+        self.latencies[key].add(seconds)
+        if size is not None:
+            self.counts[command] = self.counts.get(command, 0) + 1
+            self.bytes[command] = self.bytes.get(command, 0) + size
+        self.samples.append((time.time(), command, phase, seconds, size))
+
+    def summary(self):
+        if not self.latencies:
+            return "No samples recorded"
+        lines = ['{:<16}{:>8}{:>10}  {:<9}{:>10}{:>10}{:>10}'.format(
+            'message', 'count', 'bytes', 'phase', 'mean ms', 'p99 ms', 'max ms')]
+        commands = sorted(set(command for command, phase in self.latencies))
+        for command in commands:
+            for phase in phases:
+                hist = self.latencies.get((command, phase))
+                if not hist:
+                    continue
+                lines.append('{:<16}{:>8}{:>10}  {:<9}{:>10.3f}{:>10.3f}{:>10.3f}'.format(
+                    command, self.counts.get(command, ''),
+                    self.bytes.get(command, ''), phase,
+                    hist.total / hist.count * 1e3,
+                    hist.percentile(.99) * 1e3, hist.max * 1e3))
+        return '\n'.join(lines)
+
+    def export(self, path):
+        """Writes the raw samples as CSV"""
+        with open(path, 'w') as f:
+            f.write('time,message,phase,seconds,bytes\n')
+            for sample in self.samples:
+                f.write('{:.6f},{},{},{:.9f},{}\n'.format(*[
+                    '' if value is None else value for value in sample]))
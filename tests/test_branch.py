@@ -0,0 +1,127 @@
+"""
+Checks branch prediction against the condition codes in the Intel manual,
+for every combination of flags, and the counter width of the jcxz and loop
+families on x86 and x64.
+
+    python -m pytest tests
+"""
+
+import itertools
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import branch
+
+flags = ['of', 'sf', 'zf', 'cf', 'pf']
+
+# Jcc condition codes, written from the manual rather than from branch.py
+conditions = {
+    'o': lambda f: f['of'] == 1,
+    'no': lambda f: f['of'] == 0,
+    's': lambda f: f['sf'] == 1,
+    'ns': lambda f: f['sf'] == 0,
+    'e': lambda f: f['zf'] == 1,
+    'ne': lambda f: f['zf'] == 0,
+    'b': lambda f: f['cf'] == 1,
+    'ae': lambda f: f['cf'] == 0,
+    'be': lambda f: f['cf'] == 1 or f['zf'] == 1,
+    'a': lambda f: f['cf'] == 0 and f['zf'] == 0,
+    'l': lambda f: f['sf'] != f['of'],
+    'ge': lambda f: f['sf'] == f['of'],
+    'le': lambda f: f['zf'] == 1 or f['sf'] != f['of'],
+    'g': lambda f: f['zf'] == 0 and f['sf'] == f['of'],
+    'p': lambda f: f['pf'] == 1,
+    'np': lambda f: f['pf'] == 0,
+}
+aliases = {
+    'z': 'e', 'nz': 'ne', 'c': 'b', 'nae': 'b', 'nb': 'ae', 'nc': 'ae',
+    'na': 'be', 'nbe': 'a', 'nge': 'l', 'nl': 'ge', 'ng': 'le', 'nle': 'g',
+    'pe': 'p', 'po': 'np',
+}
+counted = ['jcxz', 'jecxz', 'jrcxz', 'loop', 'loope', 'loopz', 'loopne',
+    'loopnz']
+
+
+def expected(mnemonic, regs):
+    code = mnemonic[1:]
+    return conditions[aliases.get(code, code)](regs)
+
+
+class FlagTest(unittest.TestCase):
+    def test_every_jcc_is_known(self):
+        jccs = set('j' + code for code in list(conditions) + list(aliases))
+        self.assertEqual(set(branch.predicates) - set(counted), jccs)
+
+    def test_every_flag_combination(self):
+        for mnemonic in set(branch.predicates) - set(counted):
+            for values in itertools.product([0, 1], repeat=len(flags)):
+                regs = dict(zip(flags, values))
+                self.assertEqual(branch.predicates[mnemonic](regs),
+                    expected(mnemonic, regs), (mnemonic, regs))
+
+    def test_next_ip(self):
+        decoded = branch.decode('jne 0x401020', 0x401000, 2)
+        self.assertEqual(decoded, branch.Branch('jne', 0x401020, 0x401002))
+        self.assertEqual(branch.next_ip(decoded, {'zf': 0}), 0x401020)
+        self.assertEqual(branch.next_ip(decoded, {'zf': 1}), 0x401002)
+
+    def test_decode_ignores_other_instructions(self):
+        self.assertIsNone(branch.decode('jmp 0x401020', 0x401000, 2))
+        self.assertIsNone(branch.decode('mov eax, ebx', 0x401000, 2))
+        self.assertIsNone(branch.decode('jne eax', 0x401000, 2))
+
+
+class CounterTest(unittest.TestCase):
+    def test_jcxz_widths(self):
+        # each one tests only its own width of the counter
+        cases = [
+            (0, True, True, True),
+            (0x10000, True, False, False),
+            (0x100000000, True, True, False),
+            (0xffff, False, False, False),
+        ]
+        for value, cx, ecx, rcx in cases:
+            regs = {'rcx': value}
+            self.assertEqual(branch.predicates['jcxz'](regs), cx, value)
+            self.assertEqual(branch.predicates['jecxz'](regs), ecx, value)
+            self.assertEqual(branch.predicates['jrcxz'](regs), rcx, value)
+
+    def test_jcxz_x86(self):
+        self.assertTrue(branch.predicates['jcxz']({'ecx': 0x10000}))
+        self.assertFalse(branch.predicates['jecxz']({'ecx': 0x10000}))
+        self.assertTrue(branch.predicates['jecxz']({'ecx': 0}))
+
+    def test_loop_x64(self):
+        loop = branch.predicates['loop']
+        self.assertFalse(loop({'rcx': 1}))
+        self.assertTrue(loop({'rcx': 2}))
+        # the decrement wraps instead of stopping at zero
+        self.assertTrue(loop({'rcx': 0}))
+        # the upper half of rcx counts too
+        self.assertTrue(loop({'rcx': 0x100000001}))
+
+    def test_loop_x86(self):
+        loop = branch.predicates['loop']
+        self.assertFalse(loop({'ecx': 1}))
+        self.assertTrue(loop({'ecx': 0}))
+        self.assertTrue(loop({'ecx': 0xffffffff}))
+
+    def test_loop_conditions(self):
+        for regs in ({'rcx': 5}, {'ecx': 5}, {'rcx': 1}, {'ecx': 1}):
+            for zf in (0, 1):
+                state = dict(regs, zf=zf)
+                continues = branch.loop_continues(state)
+                self.assertEqual(branch.predicates['loope'](state),
+                    continues and zf == 1, state)
+                self.assertEqual(branch.predicates['loopz'](state),
+                    continues and zf == 1, state)
+                self.assertEqual(branch.predicates['loopne'](state),
+                    continues and zf == 0, state)
+                self.assertEqual(branch.predicates['loopnz'](state),
+                    continues and zf == 0, state)
+
+
+if __name__ == '__main__':
+    unittest.main()
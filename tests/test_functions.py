@@ -0,0 +1,72 @@
+"""
+Checks FunctionIndex against functions whose basic blocks overlap, with the
+Binary Ninja stand-in from sim/ in place of the real API.
+
+    python -m pytest tests
+"""
+
+import os
+import sys
+import unittest
+
+here = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, here)
+sys.path.insert(0, os.path.join(here, 'sim'))
+from functions import FunctionIndex
+
+
+class Block(object):
+    def __init__(self, start, end):
+        self.start = start
+        self.end = end
+
+
+class Function(object):
+    def __init__(self, name, blocks):
+        self.name = name
+        self.basic_blocks = [Block(start, end) for start, end in blocks]
+
+
+class View(object):
+    def __init__(self, functions):
+        self.functions = functions
+
+    def register_notification(self, notify):
+        pass
+
+    def unregister_notification(self, notify):
+        pass
+
+
+class LookupTest(unittest.TestCase):
+    def setUp(self):
+        # outer's block spans the shorter blocks of inner and tail
+        self.outer = Function('outer', [(0x1000, 0x1100)])
+        self.inner = Function('inner', [(0x1010, 0x1020)])
+        self.tail = Function('tail', [(0x1030, 0x1040), (0x1200, 0x1210)])
+        self.index = FunctionIndex(View([self.outer, self.inner, self.tail]))
+
+    def test_innermost_block(self):
+        self.assertIs(self.index.lookup(0x1018), self.inner)
+        self.assertIs(self.index.lookup(0x1030), self.tail)
+
+    def test_earlier_longer_block(self):
+        # the nearest block starting before these ends before them
+        self.assertIs(self.index.lookup(0x1020), self.outer)
+        self.assertIs(self.index.lookup(0x1040), self.outer)
+        self.assertIs(self.index.lookup(0x10ff), self.outer)
+
+    def test_outside_every_block(self):
+        self.assertIsNone(self.index.lookup(0xfff))
+        self.assertIsNone(self.index.lookup(0x1100))
+        self.assertIsNone(self.index.lookup(0x1210))
+
+    def test_rebuilt_after_analysis(self):
+        self.index.lookup(0x1018)
+        self.index.function_removed(None, self.inner)
+        self.index.bv.functions.remove(self.inner)
+        self.assertIs(self.index.lookup(0x1018), self.outer)
+
+
+if __name__ == '__main__':
+    unittest.main()
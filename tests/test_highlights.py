@@ -0,0 +1,156 @@
+"""
+Checks that Highlights shows the color of the highest layer and only calls
+into Binja for instructions and blocks whose visible color changed, with the
+Binary Ninja stand-in from sim/ in place of the real API.
+
+    python -m pytest tests
+"""
+
+import os
+import sys
+import unittest
+
+here = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, here)
+sys.path.insert(0, os.path.join(here, 'sim'))
+from binaryninja import HighlightStandardColor
+from highlights import Highlights, no_color
+
+red = HighlightStandardColor.RedHighlightColor
+green = HighlightStandardColor.GreenHighlightColor
+yellow = HighlightStandardColor.YellowHighlightColor
+cyan = HighlightStandardColor.CyanHighlightColor
+
+
+class Function(object):
+    def __init__(self):
+        self.calls = []
+
+    def set_auto_instr_highlight(self, addr, color):
+        self.calls.append((addr, color))
+
+
+class FunctionIndex(object):
+    """Every address is in the one function, except those in outside"""
+
+    def __init__(self):
+        self.func = Function()
+        self.outside = set()
+
+    def lookup(self, addr):
+        return None if addr in self.outside else self.func
+
+
+class Block(object):
+    def __init__(self, start):
+        self.start = start
+        self.calls = []
+
+    def set_auto_highlight(self, color):
+        self.calls.append(color)
+
+
+class LayerTest(unittest.TestCase):
+    def setUp(self):
+        self.index = FunctionIndex()
+        self.calls = self.index.func.calls
+        self.highlights = Highlights(self.index)
+
+    def flushed(self):
+        self.highlights.flush()
+        calls = list(self.calls)
+        del self.calls[:]
+        return calls
+
+    def test_highest_layer_shows(self):
+        self.highlights.set('trace', 0x1000, yellow)
+        self.highlights.set('breakpoint', 0x1000, red)
+        self.assertEqual(self.flushed(), [(0x1000, red)])
+        self.highlights.set('ip', 0x1000, green)
+        self.assertEqual(self.flushed(), [(0x1000, green)])
+
+    def test_lower_layer_shows_again(self):
+        self.highlights.set('breakpoint', 0x1000, red)
+        self.highlights.set('ip', 0x1000, green)
+        self.flushed()
+        self.highlights.discard('ip', 0x1000)
+        self.assertEqual(self.flushed(), [(0x1000, red)])
+        self.highlights.discard('breakpoint', 0x1000)
+        self.assertEqual(self.flushed(), [(0x1000, no_color)])
+
+    def test_hidden_change_isnt_repainted(self):
+        self.highlights.set('ip', 0x1000, green)
+        self.flushed()
+        # under the IP, so nothing visible changes
+        self.highlights.set('breakpoint', 0x1000, red)
+        self.highlights.set('trace', 0x1000, yellow)
+        self.assertEqual(self.flushed(), [])
+
+    def test_same_color_isnt_repainted(self):
+        self.highlights.set('breakpoint', 0x1000, red)
+        self.flushed()
+        self.highlights.set('breakpoint', 0x1000, red)
+        self.assertEqual(self.flushed(), [])
+        # set and discarded again before a flush
+        self.highlights.set('ip', 0x1000, green)
+        self.highlights.discard('ip', 0x1000)
+        self.assertEqual(self.flushed(), [])
+
+    def test_moving_ip_repaints_two_instructions(self):
+        for addr in range(0x1000, 0x1100, 4):
+            self.highlights.set('breakpoint', addr, red)
+        self.highlights.set('ip', 0x1000, green)
+        self.flushed()
+        self.highlights.discard('ip', 0x1000)
+        self.highlights.set('ip', 0x1004, green)
+        self.assertEqual(sorted(self.flushed()),
+            [(0x1000, red), (0x1004, green)])
+
+    def test_clear_layer(self):
+        self.highlights.set('trace', 0x1000, yellow)
+        self.highlights.set('trace', 0x1004, yellow)
+        self.highlights.set('ip', 0x1004, green)
+        self.flushed()
+        self.highlights.clear('trace')
+        self.assertEqual(self.flushed(), [(0x1000, no_color)])
+
+    def test_outside_any_function(self):
+        self.index.outside.add(0x1000)
+        self.highlights.set('ip', 0x1000, green)
+        self.assertEqual(self.flushed(), [])
+        self.assertEqual(self.highlights.color(0x1000), green)
+
+
+class BlockTest(unittest.TestCase):
+    def setUp(self):
+        self.highlights = Highlights(FunctionIndex())
+        self.block = Block(0x1000)
+
+    def test_block_painted_once(self):
+        self.highlights.set_block(self.block, cyan)
+        self.highlights.flush()
+        self.highlights.set_block(self.block, cyan)
+        self.highlights.flush()
+        self.assertEqual(self.block.calls, [cyan])
+
+    def test_clear_blocks(self):
+        self.highlights.set_block(self.block, cyan)
+        self.highlights.flush()
+        self.highlights.clear_blocks()
+        self.highlights.flush()
+        self.assertEqual(self.block.calls, [cyan, no_color])
+        # nothing left to clear
+        self.highlights.clear_blocks()
+        self.highlights.flush()
+        self.assertEqual(self.block.calls, [cyan, no_color])
+
+    def test_clear_all_clears_blocks(self):
+        self.highlights.set_block(self.block, cyan)
+        self.highlights.flush()
+        self.highlights.clear()
+        self.highlights.flush()
+        self.assertEqual(self.block.calls, [cyan, no_color])
+
+
+if __name__ == '__main__':
+    unittest.main()
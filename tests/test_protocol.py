@@ -0,0 +1,76 @@
+"""
+Checks that the wire protocol round-trips every value type and turns
+anything it can't represent into ProtocolError on both ends.
+
+    python -m pytest tests
+"""
+
+import os
+import struct
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import protocol
+
+
+def nested(depth):
+    value = None
+    for _ in range(depth):
+        value = [value]
+    return value
+
+
+class RoundTripTest(unittest.TestCase):
+    def test_values(self):
+        params = {'none': None, 'true': True, 'false': False, 'max': 2**64 - 1,
+            'min': -2**63, 'float': 1.5, 'text': u'caf\xe9', 'bytes': b'\0\xff',
+            'list': [1, [2, 3]], 'dict': {'a': {'b': 1}}}
+        self.assertEqual(protocol.decode(protocol.encode('print', params)),
+            ('print', params))
+
+    def test_deepest_allowed(self):
+        params = {'a': nested(protocol.max_depth - 1)}
+        self.assertEqual(protocol.decode(protocol.encode('print', params)),
+            ('print', params))
+
+
+class EncodeErrorTest(unittest.TestCase):
+    def test_unknown_type(self):
+        self.assertRaises(protocol.ProtocolError, protocol.encode, 'nope', { })
+
+    def test_int_past_64_bits(self):
+        for value in (2**64, -2**63 - 1):
+            self.assertRaises(protocol.ProtocolError, protocol.encode,
+                'print', {'a': value})
+
+    def test_long_key(self):
+        self.assertRaises(protocol.ProtocolError, protocol.encode,
+            'print', {'k' * 256: 1})
+
+    def test_too_deep(self):
+        self.assertRaises(protocol.ProtocolError, protocol.encode,
+            'print', {'a': nested(protocol.max_depth)})
+
+
+class DecodeErrorTest(unittest.TestCase):
+    def test_truncated(self):
+        data = protocol.encode('print', {'message': u'hello'})
+        for end in range(len(data)):
+            self.assertRaises(protocol.ProtocolError, protocol.decode,
+                data[:end])
+
+    def test_too_deep(self):
+        # deep enough to overflow the stack if the depth wasn't capped
+        data = struct.pack('<B', protocol.MESSAGE_TYPES['print']) + \
+            b'd' + struct.pack('<IB', 1, 1) + b'a' + \
+            (b'l' + struct.pack('<I', 1)) * 100000 + b'N'
+        self.assertRaises(protocol.ProtocolError, protocol.decode, data)
+
+    def test_not_a_dict(self):
+        data = struct.pack('<B', protocol.MESSAGE_TYPES['print']) + b'N'
+        self.assertRaises(protocol.ProtocolError, protocol.decode, data)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,96 @@
+"""
+Memory-mapped ring buffer of fixed-size trace records.
+
+The file starts with a header_size byte header followed by capacity records.
+Once capacity records have been written the oldest ones are overwritten, so
+the file never grows past header_size + capacity * record size. Readers only
+map the file, so traces of millions of records are never loaded into memory.
+
+    header  <8sIIQQQI   magic, version, record size, capacity, records
+                        written, module base, register count
+            8s * count  register names
+    record  <QB7x       IP, flags
+            <Q * count  register values before the instruction executed
+"""
+
+import mmap
+import struct
+
+magic = b'BDTRACE\0'
+version = 1
+header = struct.Struct('<8sIIQQQI')
+header_size = 256
+reg_name = struct.Struct('<8s')
+max_regs = (header_size - header.size) // reg_name.size
+count_offset = struct.calcsize('<8sIIQ')   # records written field
+
+# record flags
+branch_taken = 1
+
+
+def record_struct(reg_count):
+    return struct.Struct('<QB7x' + 'Q' * reg_count)
+
+
+class TraceWriter:
+    def __init__(self, path, capacity, base, reg_names):
+        if len(reg_names) > max_regs:
+            raise ValueError("At most {} registers can be traced".format(max_regs))
+        self.record = record_struct(len(reg_names))
+        self.capacity = capacity
+        self.count = 0
+        size = header_size + capacity * self.record.size
+
+        self.file = open(path, 'w+b')
+        self.file.truncate(size)
+        self.map = mmap.mmap(self.file.fileno(), size)
+        header.pack_into(self.map, 0, magic, version, self.record.size,
+            capacity, 0, base, len(reg_names))
+        for i, name in enumerate(reg_names):
+            reg_name.pack_into(self.map, header.size + i * reg_name.size,
+                name.encode('ascii'))
+
+    def append(self, ip, taken, regs):
+        offset = header_size + (self.count % self.capacity) * self.record.size
+        self.record.pack_into(self.map, offset, ip,
+            branch_taken if taken else 0, *regs)
+        self.count += 1
+        struct.pack_into('<Q', self.map, count_offset, self.count)
+
+    def close(self):
+        self.map.flush()
+        self.map.close()
+        self.file.close()
+
+
+class TraceReader:
+    def __init__(self, path):
+        self.file = open(path, 'rb')
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        (file_magic, file_version, record_size, self.capacity, self.written,
+            self.base, reg_count) = header.unpack_from(self.map, 0)
+        if file_magic != magic or file_version != version:
+            self.close()
+            raise ValueError("{} is not a BinDbg trace".format(path))
+
+        self.record = record_struct(reg_count)
+        if self.record.size != record_size:
+            self.close()
+            raise ValueError("{} is corrupt".format(path))
+        self.reg_names = [reg_name.unpack_from(self.map,
+            header.size + i * reg_name.size)[0].rstrip(b'\0').decode('ascii')
+            for i in range(reg_count)]
+
+    def __len__(self):
+        return min(self.written, self.capacity)
+
+    def __iter__(self):
+        """Yields (ip, taken, regs) from the oldest record to the newest"""
+        for i in range(self.written - len(self), self.written):
+            offset = header_size + (i % self.capacity) * self.record.size
+            values = self.record.unpack_from(self.map, offset)
+            yield values[0], bool(values[1] & branch_taken), values[2:]
+
+    def close(self):
+        self.map.close()
+        self.file.close()
@@ -1,31 +1,451 @@
 from multiprocessing.connection import Listener
 from pykd import *
+import ctypes
 import os
 import re
 import string
 import sys
+import tempfile
 import threading
 import time
 
-poll_time = .25
+# appended, so BinDbg's generically named modules can't shadow the ones other
+# scripts in WinDbg's shared interpreter import
+sys.path.append(os.path.dirname(os.path.abspath(sys.argv[0])))
+import protocol
+import sessionlog
+import tracefile
+from modules import ModuleTable
+from stats import Stats
+
+# events normally wake the notifier immediately; polling is only a fallback
+# in case pykd misses a state change
+poll_time = 1
+coverage_batch_size = 256
+log_batch_size = 256
+log_flush_interval = .5     # seconds, while log points keep the target running
+vtable_batch_size = 256
+page_size = 0x1000
+event_modify_state = 0x0002
 conn = None
-base = module.begin(getModulesList()[0])
-bps = { }
+modules = ModuleTable()
 ip = None
+running = False
+stepping = False    # set while windbg.py drives execution itself
+stopped = False     # the target stopped since state was last pushed
+reg_names = None
+last_regs = { }
+last_stack = []     # (ip, frame offset) of each frame, outermost first
+vtable_sites = { }      # ip -> (instr, target source, object source, loads) or None
+vtable_results = { }    # ip -> (target, object) last sent to Binja
+# matches dereferences, e.g. [eax+30h]
+deref_regex = re.compile(r"\[([^\[\]]*)\]")
+# matches symbols, e.g. {Symbol!ExampleSymbol (73b43420)}
+symbol_regex = re.compile(r"\{[^{}]*\}")
+# matches arithmetic in dereferences
+arith_regex = re.compile(r"([+-/*])")
+stats = Stats()
+session_log = None
+lock = threading.RLock()
+state_changed = threading.Event()
+
+
+class EventHandler(eventHandler):
+    """Wakes the notifier as soon as the target stops, so state is pushed
+    to Binja without waiting for the next poll"""
+
+    def __init__(self):
+        eventHandler.__init__(self)
+
+    def onBreakpoint(self, bpid):
+        if coverage and bpid in coverage.blocks:
+            with lock:
+                coverage.hit(bpid)
+            # a user breakpoint on the same address still breaks
+            return eventResult.Proceed
+        addr = bps.by_id.get(bpid)
+        if coverage and addr in coverage.shared:
+            with lock:
+                coverage.hit_shared(addr)
+        if addr in bps.rules:
+            with lock:
+                if not bps.rules[addr].hit(addr):
+                    return eventResult.Proceed
+        global stopped
+        stopped = True
+        state_changed.set()
+        return eventResult.NoChange
+
+    def onException(self, exceptInfo):
+        global stopped
+        stopped = True
+        state_changed.set()
+        return eventResult.NoChange
+
+    def onExecutionStatusChange(self, status):
+        global running, stopped
+        if status != executionStatus.Go:
+            running = False
+            stopped = True
+            state_changed.set()
+        elif not running:
+            running = True
+            # anything Binja has cached from target memory is now stale
+            if not stepping:
+                with lock:
+                    if conn:
+                        send('resumed')
+
+    def onLoadModule(self, base, name):
+        with lock:
+            mod = modules.add(base, module.end(module(base)), name)
+            if conn:
+                send('module_load', base=mod.base, end=mod.end, name=mod.name)
+        state_changed.set()
+        return eventResult.NoChange
+
+    def onUnloadModule(self, base, name):
+        with lock:
+            mod = modules.remove(base)
+            if not mod:
+                return eventResult.NoChange
+            # whatever loads here next has different code at these addresses
+            for cache in (vtable_sites, vtable_results):
+                for site in [site for site in cache
+                        if mod.base <= site < mod.end]:
+                    del cache[site]
+            if conn:
+                # while Binja can still map the sites to the module
+                vtable_visits.flush()
+                send('module_unload', base=base)
+        return eventResult.NoChange
+
+    def onChangeBreakpoints(self):
+        # our own changes keep the registry up to date already
+        if not bps.busy:
+            bps.dirty = True
+            state_changed.set()
+
+
+class BreakpointRegistry(object):
+    """Tracks WinDbg breakpoints by both ID and address, so lookups don't
+    need a pykd call per breakpoint"""
+
+    def __init__(self):
+        self.by_id = { }
+        self.by_addr = { }
+        self.dirty = True
+        self.busy = False
+        # IDs of breakpoints BinDbg manages itself, e.g. for coverage
+        self.ignored = set()
+        self.rules = { }    # address -> BreakpointRule
+
+    def __contains__(self, addr):
+        return addr in self.by_addr
+
+    def __iter__(self):
+        return iter(list(self.by_addr))
+
+    def __len__(self):
+        return len(self.by_id)
+
+    def set(self, addr):
+        self.busy = True
+        try:
+            # set unresolved BP (b/c ASLR)
+            dbgCommand('bu ' + findSymbol(addr, True))
+            shared = coverage.share(addr) if coverage else None
+            if shared:
+                # bu redefined the coverage breakpoint, which keeps its ID
+                id, bp = shared
+            else:
+                # new breakpoints are appended, so the last one is ours
+                bp = getBp(getNumberBreakpoints() - 1)
+                if breakpoint.getOffset(bp) != addr:
+                    self.dirty = True
+                    return
+                id = breakpoint.getId(bp)
+            self.by_id[id] = addr
+            self.by_addr[addr] = (id, bp)
+        finally:
+            self.busy = False
+
+    def set_many(self, addrs):
+        """Sets breakpoints on every address with one command script and
+        returns whether each one is now set"""
+        new = [addr for addr in set(addrs) if addr not in self.by_addr]
+        if new:
+            self.busy = True
+            try:
+                first = getNumberBreakpoints()
+                run_script('bu ' + findSymbol(addr, True) for addr in new)
+                for id, addr, bp in get_bps_since(first):
+                    self.by_id[id] = addr
+                    if addr not in self.by_addr:
+                        self.by_addr[addr] = (id, bp)
+                for addr in new:
+                    shared = coverage.share(addr) if coverage else None
+                    if shared:
+                        self.by_id[shared[0]] = addr
+                        self.by_addr[addr] = shared
+            finally:
+                self.busy = False
+        return [addr in self.by_addr for addr in addrs]
+
+    def remove_many(self, addrs):
+        """Clears the breakpoints on every address with one command and
+        returns whether each one was removed"""
+        ids = [self.by_addr[addr][0] for addr in set(addrs)
+            if addr in self.by_addr]
+        if ids:
+            self.busy = True
+            try:
+                dbgCommand('bc ' + ' '.join(str(id) for id in ids))
+                for id in ids:
+                    addr = self.by_id.pop(id)
+                    del self.by_addr[addr]
+                    self.rules.pop(addr, None)
+            finally:
+                self.busy = False
+        return [addr not in self.by_addr for addr in addrs]
+
+    def remove(self, addr):
+        self.busy = True
+        try:
+            self.rules.pop(addr, None)
+            id, bp = self.by_addr.pop(addr)
+            del self.by_id[id]
+            breakpoint.remove(bp)
+        finally:
+            self.busy = False
+
+    def reconcile(self):
+        """Picks up breakpoints added or removed through WinDbg and returns
+        the (added, removed) addresses"""
+        current = { }
+        for index in range(0, getNumberBreakpoints()):
+            bp = getBp(index)
+            current[breakpoint.getId(bp)] = bp
+
+        added = []
+        removed = []
+        for id in set(self.by_id) - set(current):
+            addr = self.by_id.pop(id)
+            if self.by_addr.get(addr, (None,))[0] == id:
+                del self.by_addr[addr]
+                self.rules.pop(addr, None)
+                removed.append(addr)
+        for id in set(current) - set(self.by_id) - self.ignored:
+            addr = breakpoint.getOffset(current[id])
+            self.by_id[id] = addr
+            if addr not in self.by_addr:
+                self.by_addr[addr] = (id, current[id])
+                added.append(addr)
+        self.dirty = False
+        return added, removed
+
+
+bps = BreakpointRegistry()
+
+
+class BreakpointRule(object):
+    """Decides inside the debugger whether a hit on a user breakpoint stops
+    the target, so only the hits that matter cross the pipe"""
+
+    def __init__(self, condition=None, hit_count=0, log=None):
+        self.condition = condition  # WinDbg expression, stops when non-zero
+        self.hit_count = hit_count  # stops from this hit on, earlier ones pass
+        self.log = log              # expressions to sample, never stops
+        self.hits = 0
+
+    def hit(self, addr):
+        """Counts a hit and returns whether the target should stop"""
+        self.hits += 1
+        if self.hits < self.hit_count:
+            return False
+        try:
+            if self.condition and not expr(self.condition):
+                return False
+            if self.log:
+                log_samples.add(addr, self.hits,
+                    [expr(e) for e in self.log])
+                return False
+        except DbgException as e:
+            # stop so a bad expression doesn't go unnoticed
+            print(e)
+        return True
+
+
+class LogRecorder(object):
+    """Buffers log point samples and sends them to Binja in batches"""
+
+    def __init__(self):
+        self.addrs = []
+        self.hits = []
+        self.values = []
+        self.last_flush = time.time()
+
+    def add(self, addr, hit, values):
+        self.addrs.append(addr)
+        self.hits.append(hit)
+        self.values.append(values)
+        if len(self.addrs) >= log_batch_size or \
+                time.time() - self.last_flush >= log_flush_interval:
+            self.flush()
+
+    def flush(self):
+        self.last_flush = time.time()
+        if self.addrs and conn:
+            send('log_samples', addrs=self.addrs, hits=self.hits,
+                values=self.values)
+        self.addrs = []
+        self.hits = []
+        self.values = []
+
+
+log_samples = LogRecorder()
+
+
+class VisitRecorder(object):
+    """Counts the visits to every (vtable site, target) between flushes, so
+    Binja gets real counts without a message per visit"""
+
+    def __init__(self):
+        self.counts = { }
+        self.last_flush = time.time()
+
+    def add(self, ip, target):
+        key = (ip, target)
+        self.counts[key] = self.counts.get(key, 0) + 1
+        if len(self.counts) >= vtable_batch_size:
+            self.flush()
+
+    def flush(self, force=True):
+        if not force and time.time() - self.last_flush < log_flush_interval:
+            return
+        self.last_flush = time.time()
+        if self.counts and conn:
+            keys = list(self.counts)
+            send('vtable_visits', ips=[ip for ip, target in keys],
+                targets=[target for ip, target in keys],
+                counts=[self.counts[key] for key in keys])
+        self.counts = { }
+
+
+vtable_visits = VisitRecorder()
+
+
+class CoverageRecorder(object):
+    """Arms one-shot breakpoints on basic blocks and records which blocks
+    are hit without stopping the target"""
+
+    def __init__(self, addrs):
+        self.blocks = { }   # breakpoint ID -> block ID
+        self.armed = { }    # address -> (breakpoint ID, breakpoint)
+        self.hits = []
+        block_ids = dict((addr, i) for i, addr in enumerate(addrs))
+        # bu /1 would turn a user's breakpoint into a one-shot one, so blocks
+        # that have one are counted when it's hit instead
+        self.shared = dict((addr, i) for addr, i in block_ids.items()
+            if addr in bps.by_addr)
+
+        bps.busy = True
+        try:
+            first = getNumberBreakpoints()
+            run_script('bu /1 ' + findSymbol(addr, True) for addr in addrs
+                if addr not in self.shared)
+            for id, addr, bp in get_bps_since(first):
+                if addr in block_ids:
+                    self.blocks[id] = block_ids[addr]
+                    self.armed[addr] = (id, bp)
+        finally:
+            bps.busy = False
+        bps.ignored.update(self.blocks)
+
+    def hit(self, bpid):
+        # one-shot breakpoints delete themselves, and WinDbg reuses IDs
+        self.hits.append(self.blocks.pop(bpid))
+        bps.ignored.discard(bpid)
+        if len(self.hits) >= coverage_batch_size:
+            self.flush()
+
+    def share(self, addr):
+        """Hands the breakpoint armed on addr over to the user breakpoint bu
+        has just redefined it as, and counts the block from that one's hits
+        instead. Returns its (ID, breakpoint), or None if none is armed."""
+        armed = self.armed.pop(addr, None)
+        # a block that was hit already has lost its breakpoint
+        if not armed or armed[0] not in self.blocks:
+            return None
+        self.shared[addr] = self.blocks.pop(armed[0])
+        bps.ignored.discard(armed[0])
+        return armed
+
+    def hit_shared(self, addr):
+        # only the first hit counts, like a one-shot breakpoint
+        self.hits.append(self.shared.pop(addr))
+        if len(self.hits) >= coverage_batch_size:
+            self.flush()
+
+    def flush(self):
+        if self.hits and conn:
+            send('coverage_hits', blocks=self.hits)
+        self.hits = []
+
+    def stop(self):
+        if self.blocks:
+            bps.busy = True
+            try:
+                dbgCommand('bc ' + ' '.join(str(id) for id in self.blocks))
+            finally:
+                bps.busy = False
+            bps.ignored.difference_update(self.blocks)
+            self.blocks = { }
+            self.armed = { }
+        self.flush()
+
+
+coverage = None
 
 
 def start(pipe):
     global conn
-    listener = Listener('\\\\.\\pipe\\' + pipe, backlog=0)
+    listener = Listener('\\\\.\\pipe\\' + pipe)
+    signal_ready(pipe)
 
     while True:
-        conn = listener.accept()
+        client = listener.accept()
+        with lock:
+            if conn:
+                # Binja came back (e.g. after a restart) before the old pipe
+                # broke; the newest client wins
+                stop(conn, "Replaced by a new connection from Binary Ninja")
+            conn = client
         print("Connected to Binary Ninja")
-        event_loop(conn)
+        state_changed.set()
+        t = threading.Thread(target=event_loop, args=[client])
+        t.setDaemon(True)
+        t.start()
 
 
-def stop(conn, reason):
-    conn.close()
+def signal_ready(pipe):
+    """Wakes Binja if it launched this WinDbg and is waiting on the listener"""
+    kernel32 = ctypes.windll.kernel32
+    event = kernel32.OpenEventW(event_modify_state, False,
+        ctypes.c_wchar_p(protocol.ready_event_name(pipe)))
+    if event:
+        kernel32.SetEvent(event)
+        kernel32.CloseHandle(event)
+
+
+def stop(client, reason):
+    global conn
+    client.close()
+    with lock:
+        if conn is not client:
+            return      # already replaced
+        conn = None
+        update_session_log(None)
     print(reason)
 
 
@@ -33,73 +453,178 @@ def send(command, **params):
     global conn
     
     try:
-        conn.send((command, params))
+        protocol.send(conn, command, params, stats, session_log)
     except IOError:
         return stop(conn, "Lost connection to Binary Ninja")
 
 
 def event_loop(conn):
-    global bps
-    global ip
-
     while True:
         try:
-            if conn.poll(poll_time):
+            data = protocol.recv(conn, stats, session_log)
+            # 'stats' messages flip enabled while they're processed
+            timed = stats.enabled
+            if timed:
+                start = stats.clock()
+            with lock:
                 if (getExecutionStatus() == executionStatus.Go):
                     breakin()   # COM returns before execution is stopped(?)
                     time.sleep(.1)  # quick sleep fixes it
-                    continue_executing = process(conn.recv())
+                    continue_executing = process(data)
                     if continue_executing:
                         go()
                 else:
-                    process(conn.recv())
-            
-            if (getExecutionStatus() == executionStatus.Go):
-                continue
-            
-            # check if IP has changed
-            current_ip = getIP()
-            if (current_ip != ip):
-                update_ip(current_ip)
-                update_vtable(current_ip)
-
-            # check for breakpoints added or removed through windbg
-            if getNumberBreakpoints() != len(bps):
-                update_bps()
-        except IOError:
+                    process(data)
+            if timed:
+                stats.record(data[0], 'apply', stats.clock() - start)
+        except (IOError, EOFError):
             return stop(conn, "Lost connection to Binary Ninja")
+        except protocol.ProtocolError as e:
+            print(e)
         except DbgException as e:
             print(e)
             send('print', message=str(e) + '. Try again - pykd is finicky')
 
 
+def notify_loop():
+    while True:
+        woken = state_changed.wait(poll_time)
+        state_changed.clear()
+        if conn is None:
+            continue
+
+        try:
+            with lock:
+                # without an event, fall back to comparing counts
+                # coverage breakpoints are in WinDbg's count but not in bps
+                if not woken and getNumberBreakpoints() != \
+                        len(bps) + len(bps.ignored):
+                    bps.dirty = True
+                update_state()
+        except IOError:
+            pass    # event_loop handles the lost connection
+        except (DbgException, protocol.ProtocolError) as e:
+            print(e)
+
+
+def update_state():
+    global ip, stopped
+
+    if (getExecutionStatus() == executionStatus.Go):
+        return
+
+    # every stop is reported, even one at the same IP (e.g. a breakpoint in
+    # a loop), and so is an IP changed without running (e.g. set_ip)
+    current_ip = getIP()
+    if stopped or current_ip != ip:
+        stopped = False
+        update_ip(current_ip)
+        update_stack()
+        update_vtable(current_ip)
+
+    if coverage:
+        coverage.flush()
+    log_samples.flush()
+    vtable_visits.flush(force=False)
+
+    # check for breakpoints added or removed through windbg
+    if bps.dirty:
+        update_bps()
+
+
 def process(data):
+    global coverage
     print(data)
-    global bps
     cmd, params = data
 
-    if 'bp' in cmd:
-        addr = params['addr'] + base
-        if cmd == 'set_bp' and addr not in bps:
-            # set unresolved BP (b/c ASLR)
-            dbgCommand('bu ' + findSymbol(addr, True))
-            # retrieve and save the BP we just created
-            bp = get_bp(addr)
-            bps[addr] = bp
+    if cmd in ('set_bp', 'delete_bp'):
+        addr = params['addr']
+        if cmd == 'set_bp':
+            if addr not in bps:
+                bps.set(addr)
+            condition = params.get('condition')
+            hit_count = params.get('hit_count', 0)
+            log = params.get('log')
+            rule = bps.rules.get(addr)
+            if addr in bps and (condition or hit_count or log):
+                # Binja resends rules on every sync, which mustn't reset the
+                # hits counted so far
+                if not rule or (rule.condition, rule.hit_count, rule.log) != \
+                        (condition, hit_count, log):
+                    bps.rules[addr] = BreakpointRule(condition, hit_count, log)
+            else:
+                bps.rules.pop(addr, None)
         elif cmd == 'delete_bp' and addr in bps:
-            breakpoint.remove(bps[addr])
-            del bps[addr]
+            bps.remove(addr)
+    elif cmd in ('set_bps', 'delete_bps'):
+        addrs = params['addrs']
+        if cmd == 'set_bps':
+            ok = bps.set_many(addrs)
+        else:
+            ok = bps.remove_many(addrs)
+        send('bps_result', cmd=cmd, addrs=params['addrs'], ok=ok)
+    elif cmd == 'start_coverage':
+        if coverage:
+            coverage.stop()
+        coverage = CoverageRecorder(params['addrs'])
+        send('print', message='Armed {} coverage breakpoints'.format(
+            len(coverage.blocks)))
+    elif cmd == 'stop_coverage':
+        if coverage:
+            coverage.stop()
+            coverage = None
+    elif cmd == 'read_pages':
+        send('pages', id=params['id'], pages=params['pages'],
+            data=[read_page(page) for page in params['pages']])
+    elif cmd == 'stats':
+        action = params['action']
+        if action == 'enable':
+            stats.reset()
+            stats.enabled = True
+        elif action == 'disable':
+            stats.enabled = False
+        elif action == 'show':
+            send('print', message='WinDbg side:\n' + stats.summary())
+        elif action == 'export':
+            try:
+                stats.export(params['path'])
+            except (IOError, OSError) as e:
+                # not the pipe, so event_loop mustn't see it
+                send('print', message="Can't export stats to {}: {}".format(
+                    params['path'], e))
+    elif cmd == 'session_log':
+        try:
+            update_session_log(params['path'])
+        except (IOError, OSError) as e:
+            send('print', message="Can't record session log to {}: {}".format(
+                params['path'], e))
+    elif cmd == 'record_trace':
+        record_trace(params['path'], params['steps'], params['capacity'],
+            params['regs'])
     elif cmd == 'set_ip':
-        setIP(params['ip'] + base)
+        setIP(params['ip'])
     elif cmd == 'sync':
-        send('set_ip', ip=getIP()-base, regs=get_regs())
-        for bp in bps:
-            send('set_bp', addr=bp-base)
+        if params.get('version') != protocol.VERSION:
+            send('print', message='WinDbg extension speaks BinDbg protocol '
+                'version {}, update both ends'.format(protocol.VERSION))
+            return True
+        send('sync', version=protocol.VERSION)
+        vtable_results.clear()
+        update_modules()
+        send('modules', modules=[list(mod) for mod in modules])
+        send('set_ip', ip=getIP(), regs=get_regs(full=True), full=True)
+        del last_stack[:]
+        update_stack()
+        send('set_bps', addrs=list(bps))
     elif cmd == 'go':
         go()
     elif cmd == 'break':
         breakin()
         return False    # pause execution
+    elif cmd == 'step':
+        step_until(params['mode'], params['limit'], params.get('over', False),
+            params.get('ranges', []), params.get('condition'),
+            params.get('summary', False))
     elif cmd == 'step_out':
         dbgCommand('pt; p') # stepout() is weird
     elif cmd == 'step_in':
@@ -107,136 +632,330 @@ def process(data):
     elif cmd == 'step_over':
         step()
     elif cmd == 'run_to':
-        addr = params['addr'] + base
-        # because 'pa' throws exception and won't run for some reason
-        dbgCommand('bu ' + findSymbol(addr, True))
-        go()
-        breakpoint.remove(get_bp(addr))
+        addr = params['addr']
+        if addr in bps:
+            go()
+        else:
+            # because 'pa' throws exception and won't run for some reason
+            bps.set(addr)
+            go()
+            if addr in bps:
+                bps.remove(addr)
     return True         # continue executing
 
 
 def update_ip(current_ip):
-    global bps
     global ip
     ip = current_ip
     if current_ip not in bps:
-        send('set_ip', ip=current_ip-base, regs=get_regs())
+        send('set_ip', ip=current_ip, regs=get_regs())
     else:
-        send('bp_hit', addr=current_ip-base, regs=get_regs())
-
+        send('bp_hit', addr=current_ip, regs=get_regs())
 
-def update_vtable(current_ip):
-    # matches symbols, e.g. {Symbol!ExampleSymbol (73b43420)}
-    symbol_regex = r"\{([^()]*|\([^()]*\))*\}"
-    # matches dereferences, e.g. [eax+30h]
-    deref_regex = r"\[[^\[]*\]"
-    # matches arithmetic in dereferences
-    arith_regex = r"([+-/*])"
 
+def parse_vtable_site(current_ip):
+    """Works out where the target and object of a possible vtable reference
+    come from, or returns None if the instruction at current_ip isn't one.
+    The target is read from memory at the target source if loads is set,
+    and is the value of the target source itself otherwise."""
     asm = disasm.instruction(disasm(current_ip))
-    instr = asm.split()[2]
-    ptr_target = None
-    find_object_type = False
-    ptr_object = None
-    object = None
+    parts = asm.split()
+    instr = parts[2] if len(parts) > 2 else None
+    if instr not in ('call', 'mov', 'lea'):
+        return None
+    if instr == 'mov' and 'ptr' not in asm.split(',')[1]:
+        return None
+    match = deref_regex.search(asm)
+    if not match:
+        # a call through a register, which WinDbg annotates when it points
+        # at a symbol, e.g. call eax {Module!Symbol (73b43420)}
+        if instr == 'call' and symbol_regex.search(asm):
+            return instr, parts[3], None, False
+        return None
 
-    if instr == 'call' and re.search(symbol_regex, asm):
-        # target addr is between parentheses in WinDbg disasm
-        addr = asm[asm.find("(")+1:asm.find(")")]
-        if asm.find(addr+"={") != -1:
-            return  # addr is an import
-        target = long(addr, 16)
-    elif instr == 'mov' and 'ptr' in asm.split(',')[1]:
-        find_object_type = True
-        if re.search(symbol_regex, asm):
-            # target has already been dereferenced by WinDbg
-            target = long(asm[asm.find("(")+1:asm.find(")")], 16)
-        else:
-            ptr_target = long(asm.split("=")[1], 16)
-    elif instr == 'lea' and re.search(deref_regex, asm):
-        find_object_type = True
-        # target (e.g. esi+30h) is between brackets in WinDbg disasm
-        reg_and_arith = asm[asm.find("[")+1:asm.find("]")]
-        # although lea doesn't actually deref memory, do it anyway
-        # to get a symbol, then can mark it as a pointer in binja
-        ptr_target = expr(reg_and_arith, False)
-    else:
-        # this is not a valid vtable reference
-        return
+    # the address is between brackets in WinDbg disasm (e.g. esi+30h), and
+    # symbols come with their address (e.g. Module!Symbol+8 (73b43428))
+    reg_and_arith = match.group(1)
+    deref = reg_and_arith.split(' (')[0]
 
     # attempt to determine type of the object where the vtable's coming from
     # warning: this is not always accurate (e.g. may determine it's an object
     # of type Parent when it's really of type Child)
-    if find_object_type:
-        reg_and_arith = asm[asm.find("[")+1:asm.find("]")]
-        if '!' in reg_and_arith:    # symbol
-            if '+' in reg_and_arith:    # symbol with offset
-                # remove the offset and evaluate to get object address
-                symbol = reg_and_arith.split('+')[0]
-                ptr_object = expr(symbol, False)
-            else:
-                # no offset, so just extract the address provided by WinDbg
-                addr = reg_and_arith[reg_and_arith.find("(")+1:reg_and_arith.find(")")]
-                ptr_object = long(addr, 16)
-        elif re.search(arith_regex, reg_and_arith):
-            reg_name = re.split(arith_regex, reg_and_arith)[0]
-            ptr_object = reg(reg_name)
-        elif all(char in string.hexdigits for char in reg_and_arith):
-            ptr_object = long(reg_and_arith.strip('h'), 16)
-        elif reg_and_arith.isalpha():
-            reg_name = reg_and_arith
-            ptr_object = reg(reg_name)
-
-    if ptr_target is not None:
-        if not isValid(ptr_target):
+    object_source = None
+    if '!' in reg_and_arith:    # symbol
+        if '+' in reg_and_arith:    # symbol with offset
+            # remove the offset and evaluate to get object address
+            object_source = expr(reg_and_arith.split('+')[0], False)
+        else:
+            # no offset, so just extract the address provided by WinDbg
+            addr = reg_and_arith[reg_and_arith.find("(")+1:reg_and_arith.find(")")]
+            object_source = long(addr, 16)
+    elif arith_regex.search(reg_and_arith):
+        object_source = arith_regex.split(reg_and_arith)[0]
+    elif all(char in string.hexdigits for char in reg_and_arith):
+        object_source = long(reg_and_arith.strip('h'), 16)
+    elif reg_and_arith.isalpha():
+        object_source = reg_and_arith
+
+    if instr == 'call':
+        if not isinstance(object_source, str):
+            return None     # call through a fixed pointer, e.g. an import
+        object_source = None
+    return instr, deref, object_source, True
+
+
+def update_stack():
+    """Sends the frames that changed since the last stop. Frames are
+    compared from the outermost one, so a step only resends the innermost
+    frame however deep the stack is"""
+    global last_stack
+    frames = [(frame.instructionOffset, frame.frameOffset)
+        for frame in reversed(getStack())]
+    keep = 0
+    for old, new in zip(last_stack, frames):
+        if old != new:
+            break
+        keep += 1
+    if keep == len(frames) == len(last_stack):
+        return
+    send('stack', keep=keep, frames=[ip for ip, _ in frames[keep:]])
+    last_stack = frames
+
+
+def update_vtable(current_ip):
+    try:
+        site = vtable_sites[current_ip]
+    except KeyError:
+        site = vtable_sites[current_ip] = parse_vtable_site(current_ip)
+    if site is None:
+        return
+
+    instr, target_source, object_source, loads = site
+    target = expr(target_source, False)
+    if loads:
+        if not isValid(target):
+            return
+        target = ptrPtr(target)
+    # lea doesn't actually deref memory, but do it anyway to get a symbol,
+    # then it can be marked as a pointer in binja
+    if instr != 'lea' and '!' not in findSymbol(target):
+        if instr == 'call' or not isValid(target):
             return
-        target = ptrPtr(ptr_target)
-    if ptr_object is not None and isValid(ptr_object):
-        object = ptrPtr(ptr_object)
+        # the loaded value isn't a symbol itself, so follow it as a pointer
+        target = ptrPtr(target)
+    if not isValid(target):
+        return
 
-    if isValid(target):
-        if find_object_type and object is not None:
-            send('vtable', instr=instr, target=target-base, object=object-base, ip=current_ip-base)
+    object = None
+    if object_source is not None:
+        if isinstance(object_source, str):
+            ptr_object = reg(object_source)
         else:
-            send('vtable', instr=instr, target=target-base, ip=current_ip-base)
-        
+            ptr_object = object_source
+        if isValid(ptr_object):
+            object = ptrPtr(ptr_object)
+
+    # Binja already has the comment if nothing changed since the last visit,
+    # and only needs the visit counted
+    if vtable_results.get(current_ip) != (target, object):
+        vtable_results[current_ip] = (target, object)
+        if object is not None:
+            send('vtable', instr=instr, target=target, object=object,
+                ip=current_ip)
+        else:
+            send('vtable', instr=instr, target=target, ip=current_ip)
+    vtable_visits.add(current_ip, target)
+
+
+def record_trace(path, steps, capacity, trace_regs):
+    """Single-steps the target up to steps times, writing every instruction
+    to a trace file instead of sending it over the pipe"""
+    global stepping
+    send('resumed')
+    stepping = True
+    writer = None
+    try:
+        mod = modules.lookup(getIP())
+        # a short trace doesn't need the whole ring buffer preallocated
+        writer = tracefile.TraceWriter(path, min(steps, capacity),
+            mod.base if mod else 0, trace_regs)
+        current_ip = getIP()
+        for _ in range(steps):
+            length = disasm(current_ip).length()
+            values = [reg(name) for name in trace_regs]
+            trace()
+            next_ip = getIP()
+            writer.append(current_ip, next_ip != current_ip + length, values)
+            current_ip = next_ip
+    except DbgException as e:
+        print(e)    # most likely the target exited
+    except (IOError, OSError, ValueError) as e:
+        # not the pipe, so event_loop mustn't see it
+        send('print', message="Can't record trace to {}: {}".format(path, e))
+    finally:
+        stepping = False
+        if writer:
+            writer.close()
+    if writer:
+        send('trace_done', path=path, records=writer.count)
+
+
+def step_until(mode, limit, over=False, ranges=(), condition=None,
+        summary=False):
+    """Single-steps the target until mode's stop condition holds or limit
+    instructions have run. Only the final stop reaches Binja, plus the blocks
+    entered on the way if summary is set.
+
+    Modes:
+        count       stop after limit instructions
+        branch      stop after a jump or loop is taken
+        return      stop after returning from the current function
+        leave       stop once the IP is outside the (start, end) ranges
+        condition   stop once the WinDbg expression condition is non-zero
+    """
+    global stepping
+    send('resumed')
+    stepping = True
+    entries = { }   # first IP of every block entered -> times entered
+    depth = 0       # calls stepped into and not yet returned from
+    steps = 0
+    reason = 'limit'
+    try:
+        current_ip = getIP()
+        while steps < limit:
+            instr = disasm(current_ip)
+            parts = disasm.instruction(instr).split()
+            mnemonic = parts[2] if len(parts) > 2 else ''
+            length = instr.length()
+            if over:
+                step()
+            else:
+                trace()
+            steps += 1
+
+            next_ip = getIP()
+            jumped = next_ip != current_ip + length
+            current_ip = next_ip
+            if jumped and summary:
+                entries[next_ip] = entries.get(next_ip, 0) + 1
+
+            if current_ip in bps:
+                reason = 'breakpoint'
+            elif mode == 'branch':
+                if jumped and mnemonic.startswith(('j', 'loop')):
+                    reason = 'branch'
+            elif mode == 'return':
+                if mnemonic == 'call' and jumped:
+                    depth += 1
+                elif mnemonic.startswith('ret'):
+                    if depth == 0:
+                        reason = 'return'
+                    depth -= 1
+            elif mode == 'leave':
+                if not any(start <= current_ip < end for start, end in ranges):
+                    reason = 'leave'
+            elif mode == 'condition':
+                if expr(condition):
+                    reason = 'condition'
+            if reason != 'limit':
+                break
+    except DbgException as e:
+        print(e)    # most likely the target exited, or a bad condition
+        reason = 'error'
+    finally:
+        stepping = False
+
+    if summary:
+        send('step_done', steps=steps, reason=reason, blocks=list(entries),
+            hits=list(entries.values()))
+    else:
+        send('step_done', steps=steps, reason=reason)
+
+
+def read_page(addr):
+    if not isValid(addr):
+        return None
+    try:
+        return bytearray(loadBytes(addr, page_size))
+    except DbgException:
+        return None     # part of the page is unmapped
+
+
+def update_session_log(path):
+    """Starts logging every frame to path, or stops if path is None"""
+    global session_log
+    if session_log:
+        session_log.close()
+        session_log = None
+    if path:
+        session_log = sessionlog.SessionLog(path, sessionlog.windbg)
+
+
+def update_modules():
+    modules.clear()
+    for mod in getModulesList():
+        modules.add(module.begin(mod), module.end(mod), module.name(mod))
+
 
 def update_bps():
-    global bps
-    current_bps = []
-    for index in range(0, getNumberBreakpoints()):
-        bp = getBp(index)
-        addr = breakpoint.getOffset(bp)
-        current_bps.append(addr)
-        # check for BPs added in WinDbg
-        if addr not in bps:
-            bps[addr] = bp
-            send('set_bp', addr=addr-base)
-    # check for BPs removed in WinDbg
-    for addr in bps.copy():
-        if addr not in current_bps:
-            del bps[addr]
-            send('delete_bp', addr=addr-base)
-
-
-def get_bp(addr):
-    for index in range(0, getNumberBreakpoints()):
+    added, removed = bps.reconcile()
+    for addr in added:
+        send('set_bp', addr=addr)
+    for addr in removed:
+        send('delete_bp', addr=addr)
+
+
+def run_script(commands):
+    """Runs a batch of WinDbg commands with a single dbgCommand"""
+    fd, script_path = tempfile.mkstemp(suffix='.txt')
+    with os.fdopen(fd, 'w') as script:
+        for command in commands:
+            script.write(command + '\n')
+    try:
+        dbgCommand('$$<' + script_path)
+    finally:
+        os.remove(script_path)
+
+
+def get_bps_since(first):
+    """Yields (id, addr, bp) for the breakpoints appended after index first"""
+    for index in range(first, getNumberBreakpoints()):
         bp = getBp(index)
-        if breakpoint.getOffset(bp) == addr:
-            return bp
+        yield breakpoint.getId(bp), breakpoint.getOffset(bp), bp
 
 
-def get_regs():
+def get_reg_names():
+    global reg_names
+    # the register set can't change during a session, so only resolve it once
+    if reg_names is None:
+        # TODO limited set of registers due to pykd errors
+        names = [getRegisterName(i) for i in range(0, getNumberRegisters())]
+        reg_names = [name for name in names
+            if not any(char.isdigit() for char in name)]
+    return reg_names
+
+
+def get_regs(full=False):
+    """Returns the registers that changed since the last snapshot, or every
+    register if full is set"""
+    global last_regs
     regs = { }
-    # TODO limited set of registers due to pykd errors
-    reg_names = [getRegisterName(i) for i in range(0, getNumberRegisters())
-        if not any(char.isdigit() for char in getRegisterName(i))]
-    for name in reg_names:
-        regs[name] = reg(name)
+    for name in get_reg_names():
+        value = reg(name)
+        if full or last_regs.get(name) != value:
+            regs[name] = value
+    last_regs.update(regs)
     return regs
 
 
+update_modules()
+handler = EventHandler()
+
 pipe = sys.argv[1]
 t = threading.Thread(target=start, args=[pipe])
 t.setDaemon(True)
-t.start()
\ No newline at end of file
+t.start()
+
+notifier = threading.Thread(target=notify_loop)
+notifier.setDaemon(True)
+notifier.start()
\ No newline at end of file